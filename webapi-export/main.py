@@ -5,33 +5,51 @@
 主程序入口
 """
 
+from __future__ import annotations
+
 import os
+import re
 import sys
 import json
 import logging
+import logging.handlers
 import argparse
+import getpass
+import threading
+import multiprocessing
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
+from functools import partial
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, List, Iterator, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
 
 # 添加src目录到Python路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from auth import WizNoteAuth
-from api_client import WizNoteAPIClient
-from storage import LocalStorage
-from downloader import NoteDownloader
-from converter import HTMLToMarkdownConverter
-from json_to_markdown import JsonToMarkdownConverter
+# 为知笔记文档GUID，docs 目录下每篇文档的 latest.json 位于以GUID命名的目录中
+_GUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+# 各功能模块在实际用到时才导入，避免 --convert-json、--list-kb 等命令加载无关依赖
+if TYPE_CHECKING:
+    from auth import WizNoteAuth
+    from api_client import WizNoteAPIClient
+    from downloader import NoteDownloader
 
 
 def setup_logging(config: dict):
     """设置日志"""
-    log_level = getattr(logging, config['logging']['level'].upper())
+    log_cfg = config['logging']
+    log_level = getattr(logging, log_cfg['level'].upper())
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     
     # 创建日志目录
-    log_file = config['logging']['log_file']
+    log_file = log_cfg['log_file']
     log_dir = os.path.dirname(log_file)
     if log_dir:
         os.makedirs(log_dir, exist_ok=True)
@@ -46,7 +64,7 @@ def setup_logging(config: dict):
     handlers.append(file_handler)
     
     # 控制台处理器
-    if config['logging']['console_output']:
+    if log_cfg['console_output']:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(log_level)
         console_handler.setFormatter(logging.Formatter(log_format))
@@ -59,22 +77,59 @@ def setup_logging(config: dict):
     )
 
 
+# 首次运行时据此生成配置文件
+EXAMPLE_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'config.example.json')
+
+# 导出流程中直接按键访问的配置项，加载时统一校验一次
+REQUIRED_CONFIG_KEYS = {
+    'api': ('as_url', 'timeout', 'rate_limit_per_second'),
+    'auth': ('username', 'password', 'save_token', 'token_file'),
+    'download': ('output_dir', 'max_concurrent'),
+    'sync': ('incremental',),
+    'format': ('extract_images', 'add_metadata'),
+    'logging': ('level', 'log_file', 'console_output'),
+}
+
+
 def load_config(config_file: str) -> dict:
-    """加载配置文件"""
-    with open(config_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """加载并校验配置文件"""
+    with open(config_file, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        config = orjson.loads(data)
+    else:
+        config = json.loads(data)
+    
+    missing = [
+        f"{section}.{key}"
+        for section, keys in REQUIRED_CONFIG_KEYS.items()
+        for key in keys
+        if not isinstance(config.get(section), dict) or key not in config[section]
+    ]
+    if missing:
+        raise ValueError(f"缺少配置项: {', '.join(missing)}")
+    
+    return config
+
+
+def _dumps_pretty(obj) -> bytes:
+    """序列化为带缩进的 UTF-8 JSON，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
 
 
 def save_config(config: dict, config_file: str):
     """保存配置文件"""
-    with open(config_file, 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=4)
+    with open(config_file, 'wb') as f:
+        f.write(_dumps_pretty(config))
 
 
 def check_credentials(config: dict) -> bool:
     """检查凭据是否已配置"""
-    username = config['auth']['username']
-    password = config['auth']['password']
+    auth_cfg = config['auth']
+    username = auth_cfg['username']
+    password = auth_cfg['password']
     
     if not username or not password:
         print("错误：未配置用户名或密码！")
@@ -84,11 +139,11 @@ def check_credentials(config: dict) -> bool:
     return True
 
 
-def interactive_login(config: dict) -> bool:
+def interactive_login(config: dict, config_file: str) -> bool:
     """交互式登录"""
     print("请输入您的为知笔记账号信息：")
     username = input("用户名/邮箱: ").strip()
-    password = input("密码: ").strip()
+    password = getpass.getpass("密码: ").strip()
     
     if not username or not password:
         print("用户名和密码不能为空！")
@@ -100,55 +155,73 @@ def interactive_login(config: dict) -> bool:
     # 询问是否保存
     save = input("是否保存账号信息到配置文件？(y/n): ").strip().lower()
     if save == 'y':
-        save_config(config, args.config)
+        save_config(config, config_file)
         print("账号信息已保存。")
     
     return True
 
 
-def sanitize_filename(name: str, fallback: str = "untitled", max_length: int = 80) -> str:
-    """清理文件名中的非法字符"""
-    if not name:
-        name = fallback
-    invalid_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-    for char in invalid_chars:
-        name = name.replace(char, '_')
-    name = name.strip() or fallback
-    return name[:max_length]
+# API选择逻辑已移除,现在优先使用WebSocket API,失败时自动降级到REST API
 
 
-# API选择逻辑已移除,现在优先使用WebSocket API,失败时自动降级到REST API
+def _iter_folder_tree(folders: List[str]) -> Iterator[Tuple[int, str, str, Tuple[str, ...]]]:
+    """将文件夹路径构建为前缀树，深度优先返回 (层级, 名称, 路径, 路径各级名称)
+    
+    每个路径只拆分一次；父文件夹总在其子文件夹之前，同级按名称排序。根目录 "/" 的层级为 -1。
+    """
+    # 树节点: [子节点字典, 对应的文件夹路径（中间节点为 None）]
+    root = [{}, None]
+    for folder in folders:
+        node = root
+        for part in folder.split('/'):
+            if part:
+                node = node[0].setdefault(part, [{}, None])
+        node[1] = folder
+    
+    stack = [(root, -1, 'Root', ())]
+    while stack:
+        node, level, name, parts = stack.pop()
+        if node[1] is not None:
+            yield level, name, node[1], parts
+        children = node[0]
+        for child_name in sorted(children, reverse=True):
+            stack.append((children[child_name], level + 1, child_name, parts + (child_name,)))
 
 
-def list_folders(api_client: WizNoteAPIClient):
+def list_folders(api_client: WizNoteAPIClient, folders: Optional[List[str]] = None):
     """
     列出所有文件夹
     
     Args:
         api_client: API客户端
+        folders: 已获取的文件夹列表，为空时从服务器获取
     """
     print("\n您的文件夹列表：")
     print("-" * 50)
     
-    folders = api_client.get_all_folders()
+    if folders is None:
+        folders = api_client.get_all_folders()
     if not folders:
         print("未找到任何文件夹。")
         return
     
-    # 按层级显示文件夹
-    for folder in sorted(folders):
-        level = folder.count('/') - 2  # 计算层级
-        indent = "  " * level
-        folder_name = folder.strip('/').split('/')[-1] if folder != '/' else 'Root'
-        print(f"{indent}{folder_name} ({folder})")
+    # 按层级显示文件夹：前缀树一次算出层级和名称，拼接后一次性输出
+    rows = list(_iter_folder_tree(folders))
+    # 预先生成各层级的缩进字符串
+    indents = ["  " * level for level in range(max(row[0] for row in rows) + 1)]
+    sys.stdout.write('\n'.join(
+        f"{indents[level] if level > 0 else ''}{name} ({folder})"
+        for level, name, folder, _ in rows
+    ) + '\n')
 
 
-def list_knowledge_bases(auth: WizNoteAuth):
+def list_knowledge_bases(auth: WizNoteAuth, kb_list: Optional[List[dict]] = None):
     """列出所有知识库"""
     print("\n您的知识库列表：")
     print("-" * 50)
     
-    kb_list = auth.get_kb_list()
+    if kb_list is None:
+        kb_list = auth.get_kb_list()
     if not kb_list:
         print("未找到任何知识库。")
         return
@@ -181,13 +254,113 @@ def incremental_backup(downloader: NoteDownloader):
     downloader.download_all()
 
 
-def convert_all_json_to_markdown(docs_dir: str = 'docs', output_dir: str = 'outputs/md'):
+def _write_bytes(path, data: bytes):
+    """直接用 os.open/os.write 写入整个文件，省去文件对象和缓冲层的开销
+    
+    先写入同目录下的临时文件再替换目标文件，中途出错或被中断时不会留下写了一半的文件。
+    """
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _unique_name(base: str, ext: str, used: set, counters: dict) -> str:
+    """分配不与 used 冲突的文件名，冲突时依次添加 _1、_2 ... 序号
+    
+    counters 记录每个基础名下一个待尝试的序号，大量同名文件时无需每次从 1 开始探测。
+    """
+    name = f"{base}{ext}"
+    if name in used:
+        counter = counters.get(base, 1)
+        name = f"{base}_{counter}{ext}"
+        while name in used:
+            counter += 1
+            name = f"{base}_{counter}{ext}"
+        counters[base] = counter + 1
+    used.add(name)
+    return name
+
+
+def _iter_latest_json(root: str) -> Iterator[str]:
+    """使用 os.scandir 遍历目录树，逐个返回 latest.json 文件路径"""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name == 'latest.json':
+                        yield entry.path
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"无法读取目录 {current}: {e}")
+
+
+def _init_worker_logging(log_queue, log_level: int):
+    """转换子进程的日志初始化：日志记录统一发送到主进程写出，避免多进程争用日志文件"""
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(log_level)
+
+
+def _convert_json_file(json_file: str) -> Tuple[str, Optional[str], Optional[bytes]]:
+    """在子进程中转换单个 latest.json 文件
+    
+    文件名生成和 UTF-8 编码也在子进程中完成，主进程只负责分配不冲突的文件名和写入。
+    
+    Returns:
+        (文件路径, 基础文件名, 编码后的 Markdown 内容)，转换失败时后两项为 None
+    """
+    from json_to_markdown import JsonToMarkdownConverter
+    
+    converter = JsonToMarkdownConverter()
+    markdown_content = converter.convert_to_content(json_file)
+    if markdown_content is None:
+        return json_file, None, None
+    
+    # 使用 Markdown 内容的前15个字符作为文件名
+    base_filename = converter.get_filename_from_content(markdown_content, max_length=15)
+    
+    # 内容为空时使用文档GUID命名，避免大量 untitled_N.md
+    if base_filename == 'untitled':
+        parent_name = os.path.basename(os.path.dirname(json_file))
+        if _GUID_RE.match(parent_name):
+            base_filename = parent_name
+    
+    return json_file, base_filename, markdown_content.encode('utf-8')
+
+
+# 记录 latest.json 与输出文件名的对应关系，用于跳过未修改的文件
+CONVERT_MANIFEST = '.convert_manifest.json'
+
+
+def convert_all_json_to_markdown(docs_dir: str = 'docs', output_dir: str = 'outputs/md',
+                                 force: bool = False):
     """
     批量转换所有 latest.json 文件为 Markdown 格式
     
+    转换和编码在多进程中并行执行，文件名分配和写入仍在主进程中按顺序进行，保证输出文件名稳定。
+    输出文件比 latest.json 新时跳过该文件，已转换过的文件重新转换时沿用原文件名。
+    
     Args:
         docs_dir: docs 目录路径
         output_dir: 输出目录路径
+        force: 忽略修改时间，重新转换所有文件
     """
     logger = logging.getLogger(__name__)
     docs_path = Path(docs_dir)
@@ -198,88 +371,148 @@ def convert_all_json_to_markdown(docs_dir: str = 'docs', output_dir: str = 'outp
         print(f"错误: docs 目录不存在: {docs_dir}")
         return
     
-    # 查找所有 latest.json 文件
-    json_files = list(docs_path.rglob('latest.json'))
-    
-    if not json_files:
-        logger.warning(f"在 {docs_dir} 目录下未找到任何 latest.json 文件")
-        print(f"警告: 在 {docs_dir} 目录下未找到任何 latest.json 文件")
-        return
-    
-    print(f"\n找到 {len(json_files)} 个 latest.json 文件")
-    print(f"输出目录: {output_path}")
+    print(f"\n输出目录: {output_path}")
     print("开始转换...\n")
     
-    # 创建转换器
-    converter = JsonToMarkdownConverter()
-    
     # 统计
+    total_count = 0
     success_count = 0
     fail_count = 0
+    skipped_count = 0
     
     # 确保输出目录存在
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # 遍历转换
-    for i, json_file in enumerate(json_files, 1):
+    # 已有输出文件及其修改时间，只扫描一次输出目录，后续冲突检查在内存中完成
+    with os.scandir(output_path) as entries:
+        output_mtimes = {entry.name: entry.stat().st_mtime for entry in entries}
+    used_filenames = set(output_mtimes)
+    name_counters = {}
+    
+    manifest_file = output_path / CONVERT_MANIFEST
+    manifest = {}
+    if CONVERT_MANIFEST in output_mtimes:
         try:
-            # 构建相对路径用于显示
-            relative_path = json_file.relative_to(docs_path)
-            
-            # 转换为 Markdown 内容
-            print(f"[{i}/{len(json_files)}] 转换: {relative_path}")
-            
-            markdown_content = converter.convert_to_content(str(json_file))
-            
-            if markdown_content is None:
-                fail_count += 1
-                print(f"  ✗ 失败: 无法读取或转换 {json_file}")
-                continue
-            
-            # 使用 Markdown 内容的前15个字符作为文件名
-            base_filename = converter.get_filename_from_content(markdown_content, max_length=15)
-            output_filename = f"{base_filename}.md"
-            
-            # 所有文件直接放在输出目录下
-            output_file = output_path / output_filename
-            
-            # 如果文件名冲突，添加序号
-            counter = 1
-            while output_file.exists():
-                output_filename = f"{base_filename}_{counter}.md"
-                output_file = output_path / output_filename
-                counter += 1
+            data = manifest_file.read_bytes()
+            manifest = orjson.loads(data) if orjson is not None else json.loads(data)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取转换记录失败，将重新转换所有文件: {e}")
+    
+    def iter_pending() -> Iterator[str]:
+        """过滤掉输出文件比源文件新的 latest.json"""
+        nonlocal skipped_count
+        for json_file in _iter_latest_json(docs_dir):
+            if not force:
+                output_name = manifest.get(os.path.relpath(json_file, docs_dir))
+                if (output_name in output_mtimes
+                        and output_mtimes[output_name] >= os.stat(json_file).st_mtime):
+                    skipped_count += 1
+                    continue
+            yield json_file
+    
+    # 子进程日志经队列交给主进程已配置的处理器输出
+    root_logger = logging.getLogger()
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *root_logger.handlers, respect_handler_level=True
+    )
+    listener.start()
+    
+    # Executor.map 在返回第一个结果前就会读完整个输入，这里先收集待转换文件，顺便得到总数；
+    # 结果按提交顺序返回
+    pending = list(iter_pending())
+    pending_count = len(pending)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            initializer=_init_worker_logging,
+            initargs=(log_queue, root_logger.level),
+        ) as executor:
+            results = executor.map(_convert_json_file, pending, chunksize=16)
             
-            # 写入文件
-            try:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(markdown_content)
-                
-                success_count += 1
-                print(f"  ✓ 成功: {output_filename}")
-                logger.info(f"成功转换: {json_file} -> {output_file}")
-                
-            except Exception as write_error:
-                fail_count += 1
-                logger.error(f"写入文件失败 {output_file}: {str(write_error)}")
-                print(f"  ✗ 失败: 无法写入 {output_filename}")
-                
-        except Exception as e:
-            fail_count += 1
-            logger.error(f"转换失败 {json_file}: {str(e)}")
-            print(f"  ✗ 失败: {json_file} - {str(e)}")
+            for i, (json_file, base_filename, data) in enumerate(results, 1):
+                total_count = i
+                # 每个文件的输出先缓存，迭代结束时一次性写出
+                out = []
+                try:
+                    # 构建相对路径用于显示
+                    relative_path = os.path.relpath(json_file, docs_dir)
+                    
+                    out.append(f"[{i}/{pending_count}] 转换: {relative_path}")
+                    
+                    if data is None:
+                        fail_count += 1
+                        out.append(f"  ✗ 失败: 无法读取或转换 {json_file}")
+                        continue
+                    
+                    # 之前转换过的文件沿用原文件名，直接覆盖
+                    output_filename = manifest.get(relative_path)
+                    if output_filename is None:
+                        # 如果文件名冲突，添加序号
+                        output_filename = _unique_name(base_filename, '.md', used_filenames, name_counters)
+                        manifest[relative_path] = output_filename
+                    
+                    # 所有文件直接放在输出目录下
+                    output_file = output_path / output_filename
+                    
+                    # 写入文件
+                    try:
+                        _write_bytes(output_file, data)
+                        
+                        success_count += 1
+                        out.append(f"  ✓ 成功: {output_filename}")
+                        logger.info(f"成功转换: {json_file} -> {output_file}")
+                        
+                    except Exception as write_error:
+                        fail_count += 1
+                        logger.error(f"写入文件失败 {output_file}: {str(write_error)}")
+                        out.append(f"  ✗ 失败: 无法写入 {output_filename}")
+                        
+                except Exception as e:
+                    fail_count += 1
+                    logger.error(f"转换失败 {json_file}: {str(e)}")
+                    out.append(f"  ✗ 失败: {json_file} - {str(e)}")
+                finally:
+                    sys.stdout.write('\n'.join(out) + '\n')
+    finally:
+        listener.stop()
+    
+    if total_count:
+        try:
+            if orjson is not None:
+                manifest_file.write_bytes(orjson.dumps(manifest))
+            else:
+                manifest_file.write_text(json.dumps(manifest, ensure_ascii=False), encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"保存转换记录失败: {e}")
+    
+    if not total_count and not skipped_count:
+        logger.warning(f"在 {docs_dir} 目录下未找到任何 latest.json 文件")
+        print(f"警告: 在 {docs_dir} 目录下未找到任何 latest.json 文件")
+        return
     
     # 输出统计
     print("\n转换完成！")
+    print(f"共处理: {total_count} 个 latest.json 文件")
     print(f"成功: {success_count} 个")
     print(f"失败: {fail_count} 个")
+    print(f"跳过: {skipped_count} 个（未修改）")
     print(f"输出目录: {output_path.absolute()}")
 
 
+# 导出笔记时每处理这么多篇笔记刷新一次控制台输出
+OUTPUT_FLUSH_INTERVAL = 32
+
+# 增量导出索引文件，保存在导出目录中
+NOTE_INDEX_FILE = '.note_index.db'
+
+
 def export_notes_to_markdown(
     api_client: WizNoteAPIClient,
     output_dir: str,
     folders_filter: Optional[List[str]] = None,
+    folders: Optional[list] = None,
+    incremental: bool = False,
 ):
     """导出笔记为 Markdown
     
@@ -289,7 +522,13 @@ def export_notes_to_markdown(
         api_client: API客户端
         output_dir: 输出目录
         folders_filter: 可选的文件夹过滤列表
+        folders: 已获取的文件夹列表，为空时从服务器获取
+        incremental: 跳过自上次导出后未修改且输出文件仍存在的笔记
     """
+    from json_to_markdown import JsonToMarkdownConverter, sanitize_filename
+    from converter import HTMLToMarkdownConverter
+    from cache import NoteIndex
+    
     # 检查WebSocket配置
     ws_config = api_client.config.get('websocket', {})
     websocket_available = ws_config.get('enabled', False)
@@ -297,11 +536,11 @@ def export_notes_to_markdown(
         print("⚠ WebSocket API未启用,将仅使用 REST API")
         print("提示: 在 config.json 中设置 websocket.enabled=true 可启用 WebSocket API")
 
-    converter = JsonToMarkdownConverter()
     base_path = Path(output_dir)
     base_path.mkdir(parents=True, exist_ok=True)
 
-    folders = api_client.get_all_folders()
+    if folders is None:
+        folders = api_client.get_all_folders()
     if not folders:
         print("未找到任何文件夹。")
         return
@@ -323,12 +562,14 @@ def export_notes_to_markdown(
         filter_set = set(folders_filter)
         normalized_folders = [folder for folder in normalized_folders if folder['path'] in filter_set]
         if not normalized_folders:
-            print("未匹配到指定的文件夹，使用全部文件夹继续。")
-            normalized_folders = [normalize_folder(item) for item in folders]
+            print(f"未匹配到指定的文件夹: {', '.join(folders_filter)}")
+            print("使用 --list 参数查看所有可用的文件夹")
+            return
 
     total_notes = 0
     success_notes = 0
     failed_notes = 0
+    skipped_notes = 0
     websocket_success = 0
     rest_fallback_success = 0
     conversion_failures = []  # 记录转换失败的笔记
@@ -340,122 +581,240 @@ def export_notes_to_markdown(
     raw_json_base.mkdir(parents=True, exist_ok=True)
     print(f"WebSocket原始JSON保存到: {raw_json_base.absolute()}\n")
 
-    for folder in sorted(normalized_folders, key=lambda f: f['path']):
-        folder_path = folder['path']
-        relative = folder_path.strip('/')
-        target_dir = base_path if not relative else base_path / Path(*[part for part in relative.split('/') if part])
-        target_dir.mkdir(parents=True, exist_ok=True)
-        print(f"\n处理文件夹: {folder_path}")
+    note_index = NoteIndex(str(base_path / NOTE_INDEX_FILE)) if incremental else None
+
+    # 已确认存在的目录，避免每篇笔记重复 mkdir；多个线程偶尔重复创建同一目录也无妨
+    ensured_dirs = {base_path, raw_json_base}
 
-        for note in api_client.get_all_notes_in_folder(folder_path):
-            total_notes += 1
+    def ensure_dir(directory: Path):
+        if directory not in ensured_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            ensured_dirs.add(directory)
+
+    def assign_stems(notes: Iterator[dict], parts: Tuple[str, ...]) -> Iterator[Tuple[dict, str]]:
+        """在主线程中按笔记顺序分配文件名，同一文件夹内同名笔记依次添加序号而不是互相覆盖
+        
+        增量导出时，索引中记录过的文件名归原笔记所有：标题未变的笔记沿用原文件名，
+        其他笔记不会分到这些文件名，同名笔记的增删和顺序变化不会让文件名在笔记之间互换。
+        """
+        used, counters = set(), {}
+        owned = note_index.stems_in('/'.join(parts)) if note_index is not None else {}
+        used.update(owned.values())
+        for note in notes:
             doc_guid = note.get('docGuid')
             title = note.get('title') or doc_guid or 'untitled'
+            base = sanitize_filename(title, fallback=doc_guid or 'untitled')
+            stem = owned.get(doc_guid)
+            if stem is not None and (stem == base or (
+                    stem.startswith(base + '_') and stem[len(base) + 1:].isdigit())):
+                yield note, stem
+            else:
+                yield note, _unique_name(base, '', used, counters)
 
-            print(f"  -> 获取笔记 {title} ({doc_guid})")
-            
-            markdown = None
-            used_api = None
-            
-            # 策略: 优先尝试WebSocket API
-            if websocket_available:
-                try:
-                    detail = api_client.get_note_detail_via_websocket(doc_guid)
-                    if detail:
-                        # 保存原始JSON
-                        raw_json_folder = raw_json_base / Path(*[part for part in relative.split('/') if part]) if relative else raw_json_base
-                        raw_json_folder.mkdir(parents=True, exist_ok=True)
-                        raw_json_file = raw_json_folder / (sanitize_filename(title, fallback=doc_guid or 'untitled') + '.json')
-                        try:
-                            import json
-                            with open(raw_json_file, 'w', encoding='utf-8') as f:
-                                json.dump(detail, f, ensure_ascii=False, indent=2)
-                        except Exception as json_exc:
-                            print(f"     ⚠ 保存原始JSON失败: {json_exc}")
-
-                        # 提取并转换数据
-                        note_data = detail.get('data') or detail
-                        if isinstance(note_data, dict) and 'blocks' not in note_data and 'data' in note_data:
-                            note_data = note_data['data']
-
-                        try:
-                            markdown = converter.convert(note_data)
-                            if markdown and markdown.strip():
-                                used_api = 'WebSocket'
-                                websocket_success += 1
-                                print("     ✓ WebSocket API成功")
-                        except Exception as conv_exc:
-                            print(f"     ⚠ WebSocket转换失败: {conv_exc}, 尝试REST API...")
-                except Exception as ws_exc:
-                    print(f"     ⚠ WebSocket获取失败: {ws_exc}, 尝试REST API...")
-            
-            # 降级: 如果WebSocket失败,尝试REST API
-            if not markdown or not markdown.strip():
-                try:
-                    note_content = api_client.download_note(doc_guid)
-                    if note_content:
-                        # 如果返回的是HTML,直接使用或转换
-                        if isinstance(note_content, dict) and 'html' in note_content:
-                            html_content = note_content['html']
-                        else:
-                            html_content = str(note_content)
-                        
-                        try:
-                            html_converter = HTMLToMarkdownConverter(api_client.config)
-                            markdown = html_converter.convert(html_content)
-                            if markdown and markdown.strip():
-                                used_api = 'REST'
-                                rest_fallback_success += 1
-                                print("     ✓ REST API降级成功")
-                        except Exception as conv_exc:
-                            print(f"     ✗ REST API转换失败: {conv_exc}")
-                except Exception as rest_exc:
-                    print(f"     ✗ REST API获取失败: {rest_exc}")
-            
-            # 检查最终结果
-            if not markdown or not markdown.strip():
-                failed_notes += 1
-                conversion_failures.append({
+    # 两种转换器在转换过程中都保存中间状态，每个线程各自创建一次并在后续笔记中复用
+    thread_local = threading.local()
+
+    def get_converter() -> JsonToMarkdownConverter:
+        converter = getattr(thread_local, 'converter', None)
+        if converter is None:
+            converter = thread_local.converter = JsonToMarkdownConverter()
+        return converter
+
+    def get_html_converter() -> HTMLToMarkdownConverter:
+        html_converter = getattr(thread_local, 'html_converter', None)
+        if html_converter is None:
+            html_converter = thread_local.html_converter = HTMLToMarkdownConverter(api_client.config)
+        return html_converter
+
+    def export_note(folder_path: str, target_dir: Path, raw_json_folder: Path, item: Tuple[dict, str]) -> dict:
+        """获取、转换并写入单篇笔记，在线程池中执行
+
+        Returns:
+            {'api': 成功使用的API或None, 'lines': 控制台输出, 'failure': 失败记录或None}
+        """
+        # 原始JSON和Markdown使用同一个文件名 stem
+        note, stem = item
+        doc_guid = note.get('docGuid')
+        title = note.get('title') or doc_guid or 'untitled'
+        lines = [f"  -> 获取笔记 {title} ({doc_guid})"]
+        
+        # 输出文件相对导出目录的路径，记录在增量索引中
+        output_file = target_dir / (stem + '.md')
+        relative_file = output_file.relative_to(base_path).as_posix()
+        
+        # 只有索引记录的正是这个文件、且文件仍在时才跳过
+        if (note_index is not None and note_index.is_unchanged(note)
+                and note_index.filename(doc_guid) == relative_file and output_file.exists()):
+            lines.append("     - 未修改，跳过")
+            return {'api': None, 'skipped': True, 'note': note, 'lines': lines, 'failure': None}
+        
+        markdown = None
+        used_api = None
+        
+        # 策略: 优先尝试WebSocket API
+        if websocket_available:
+            try:
+                detail = api_client.get_note_detail_via_websocket(doc_guid)
+                if detail:
+                    # 保存原始JSON
+                    ensure_dir(raw_json_folder)
+                    raw_json_file = raw_json_folder / (stem + '.json')
+                    try:
+                        _write_bytes(raw_json_file, _dumps_pretty(detail))
+                    except Exception as json_exc:
+                        lines.append(f"     ⚠ 保存原始JSON失败: {json_exc}")
+
+                    # 提取并转换数据
+                    note_data = detail.get('data') or detail
+                    if isinstance(note_data, dict) and 'blocks' not in note_data and 'data' in note_data:
+                        note_data = note_data['data']
+
+                    try:
+                        markdown = get_converter().convert(note_data)
+                        if markdown and markdown.strip():
+                            used_api = 'WebSocket'
+                            lines.append("     ✓ WebSocket API成功")
+                    except Exception as conv_exc:
+                        lines.append(f"     ⚠ WebSocket转换失败: {conv_exc}, 尝试REST API...")
+            except Exception as ws_exc:
+                lines.append(f"     ⚠ WebSocket获取失败: {ws_exc}, 尝试REST API...")
+        
+        # 降级: 如果WebSocket失败,尝试REST API
+        if not markdown or not markdown.strip():
+            try:
+                note_content = api_client.download_note(doc_guid)
+                if note_content:
+                    # 如果返回的是HTML,直接使用或转换
+                    if isinstance(note_content, dict) and 'html' in note_content:
+                        html_content = note_content['html']
+                    else:
+                        html_content = str(note_content)
+                    
+                    try:
+                        markdown, _ = get_html_converter().convert(html_content, note, [])
+                        if markdown and markdown.strip():
+                            used_api = 'REST'
+                            lines.append("     ✓ REST API降级成功")
+                    except Exception as conv_exc:
+                        lines.append(f"     ✗ REST API转换失败: {conv_exc}")
+            except Exception as rest_exc:
+                lines.append(f"     ✗ REST API获取失败: {rest_exc}")
+        
+        # 检查最终结果
+        if not markdown or not markdown.strip():
+            lines.append("     ✗ 所有API均失败")
+            return {
+                'api': None,
+                'note': note,
+                'lines': lines,
+                'failure': {
                     'doc_guid': doc_guid,
                     'title': title,
                     'folder': folder_path,
                     'error': '所有API均失败或转换结果为空',
                     'timestamp': datetime.now().isoformat()
-                })
-                print("     ✗ 所有API均失败")
-                continue
-            
-            # 写入Markdown文件
-            filename = sanitize_filename(title, fallback=doc_guid or 'untitled') + '.md'
-            output_file = target_dir / filename
-            try:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(markdown)
-                success_notes += 1
-                print(f"     ✓ 已导出: {output_file.name} (via {used_api})")
-            except Exception as exc:
-                failed_notes += 1
-                conversion_failures.append({
+                }
+            }
+        
+        # 写入Markdown文件
+        try:
+            _write_bytes(output_file, markdown.encode('utf-8'))
+            lines.append(f"     ✓ 已导出: {output_file.name} (via {used_api})")
+        except Exception as exc:
+            lines.append(f"     ✗ 写入文件失败: {exc}")
+            return {
+                'api': None,
+                'note': note,
+                'lines': lines,
+                'failure': {
                     'doc_guid': doc_guid,
                     'title': title,
                     'folder': folder_path,
                     'error': f'写入Markdown文件失败: {str(exc)}',
                     'timestamp': datetime.now().isoformat()
-                })
-                print(f"     ✗ 写入文件失败: {exc}")
+                }
+            }
+        return {'api': used_api, 'note': note, 'file': relative_file, 'lines': lines, 'failure': None}
+
+    def submit_all(executor: ThreadPoolExecutor) -> Iterator:
+        """依次列出各文件夹的笔记并提交导出任务；先产出文件夹路径作为分隔标记，再产出各笔记的 Future"""
+        folder_paths = [folder['path'] for folder in normalized_folders]
+        tree = list(_iter_folder_tree(folder_paths))
+        # 按目录树顺序遍历，后续几个文件夹的第一页笔记列表提前并发获取
+        # 导出不使用摘要，列表请求不带摘要以减小每页的数据量
+        walk = api_client.walk_kb([folder_path for _, _, folder_path, _ in tree], with_abstract=False)
+        for (_, _, folder_path, parts), (_, notes) in zip(tree, walk):
+            target_dir = base_path.joinpath(*parts)
+            raw_json_folder = raw_json_base.joinpath(*parts)
+            ensure_dir(target_dir)
+            yield folder_path
+
+            task = partial(export_note, folder_path, target_dir, raw_json_folder)
+            for item in assign_stems(notes, parts):
+                yield executor.submit(task, item)
+
+    # 笔记的获取、转换和写入并发执行，结果按笔记顺序汇总输出。
+    # 最多提前提交 window 个任务：既限制内存中的待处理笔记数，又能在等待前面结果时
+    # 继续列出后续页和后续文件夹的笔记，避免文件夹之间线程池空闲
+    max_workers = api_client.config['download']['max_concurrent']
+    window = max_workers * 4
+    # 控制台输出先缓存，每 OUTPUT_FLUSH_INTERVAL 篇笔记写出一次
+    output_buf = []
+    # 中途出错或被中断时也要提交已记录的索引，否则下次会重新导出这些笔记
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            tasks = submit_all(executor)
+            while True:
+                while len(pending) < window:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    pending.append(task)
+                if not pending:
+                    break
+
+                task = pending.popleft()
+                if isinstance(task, str):
+                    output_buf.append(f"\n处理文件夹: {task}")
+                    continue
+
+                result = task.result()
+                total_notes += 1
+                output_buf.extend(result['lines'])
+                if total_notes % OUTPUT_FLUSH_INTERVAL == 0:
+                    sys.stdout.write('\n'.join(output_buf) + '\n')
+                    output_buf.clear()
+                if result['api'] == 'WebSocket':
+                    websocket_success += 1
+                elif result['api'] == 'REST':
+                    rest_fallback_success += 1
+                if result.get('skipped'):
+                    skipped_notes += 1
+                elif result['failure']:
+                    failed_notes += 1
+                    conversion_failures.append(result['failure'])
+                else:
+                    success_notes += 1
+                    if note_index is not None:
+                        note_index.record(result['note'], result['file'])
+    finally:
+        if note_index is not None:
+            note_index.close()
+
+    if output_buf:
+        sys.stdout.write('\n'.join(output_buf) + '\n')
 
     # 保存转换失败记录
     if conversion_failures:
         failure_log_path = Path(output_dir) / 'conversion_failures.json'
         try:
-            import json
-            with open(failure_log_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'total_failures': len(conversion_failures),
-                    'strategy': 'WebSocket优先, REST降级',
-                    'export_time': datetime.now().isoformat(),
-                    'failures': conversion_failures
-                }, f, ensure_ascii=False, indent=2)
+            _write_bytes(failure_log_path, _dumps_pretty({
+                'total_failures': len(conversion_failures),
+                'strategy': 'WebSocket优先, REST降级',
+                'export_time': datetime.now().isoformat(),
+                'failures': conversion_failures
+            }))
             print(f"\n⚠ 转换失败记录已保存到: {failure_log_path.absolute()}")
         except Exception as log_exc:
             print(f"\n⚠ 保存失败记录时出错: {log_exc}")
@@ -464,10 +823,11 @@ def export_notes_to_markdown(
     print(f"总笔记: {total_notes}")
     print(f"成功: {success_notes} (WebSocket: {websocket_success}, REST降级: {rest_fallback_success})")
     print(f"失败: {failed_notes}")
+    if incremental:
+        print(f"跳过: {skipped_notes}（未修改）")
     print(f"输出目录: {Path(output_dir).absolute()}")
     print(f"原始JSON目录: {raw_json_base.absolute()}")
 
-
 def main():
     parser = argparse.ArgumentParser(
         description='为知笔记备份工具',
@@ -576,12 +936,31 @@ def main():
         help='Markdown 输出目录 (默认: outputs/md)'
     )
 
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='重新转换/导出未修改的文件（忽略 --convert-json 的清单和增量导出索引）'
+    )
+
     parser.add_argument(
         '--export-md',
         action='store_true',
         help='导出笔记为 Markdown 格式'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='禁用API响应缓存（ETag条件请求）'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        metavar='N',
+        help='并发下载数，覆盖配置中的 download.max_concurrent'
+    )
+
     parser.add_argument(
         '--export-output',
         default='outputs/markdown',
@@ -597,22 +976,19 @@ def main():
         print(f"配置文件不存在: {args.config}")
         print("正在创建默认配置文件...")
         
-        # 创建默认配置
-        default_config_path = os.path.join(
-            os.path.dirname(__file__), 
-            'config', 
-            'config.json'
-        )
-        os.makedirs(os.path.dirname(args.config), exist_ok=True)
-        
-        # 复制默认配置
-        import shutil
-        shutil.copy(default_config_path, args.config)
-        
-        config = load_config(args.config)
+        # 以随程序发布的示例配置为模板，按脚本所在目录定位，与当前工作目录无关
+        config_dir = os.path.dirname(args.config)
+        if config_dir:
+            os.makedirs(config_dir, exist_ok=True)
+        with open(EXAMPLE_CONFIG_FILE, 'rb') as src, open(args.config, 'wb') as dst:
+            dst.write(src.read())
         print(f"已创建配置文件: {args.config}")
         print("请编辑配置文件填写您的账号信息后重新运行。")
         return
+    except ValueError as e:
+        print(f"配置文件无效: {args.config}")
+        print(f"错误: {e}")
+        return
     
     # 设置日志
     setup_logging(config)
@@ -620,12 +996,13 @@ def main():
     
     # 如果是 JSON 转换模式
     if args.convert_json:
-        convert_all_json_to_markdown(args.json_dir, args.md_output)
+        convert_all_json_to_markdown(args.json_dir, args.md_output, force=args.force)
         return
     
     # 覆盖配置
+    dl_cfg = config['download']
     if args.output:
-        config['download']['output_dir'] = args.output
+        dl_cfg['output_dir'] = args.output
     
     if args.no_convert:
         config['format']['convert_to_markdown'] = False
@@ -633,13 +1010,25 @@ def main():
     if args.incremental:
         config['sync']['incremental'] = True
     
+    if args.no_cache:
+        config.setdefault('cache', {})['enabled'] = False
+    
+    if args.concurrency:
+        dl_cfg['max_concurrent'] = max(1, args.concurrency)
+    
     # 检查凭据
     if not args.login and not check_credentials(config):
-        if not interactive_login(config):
+        if not interactive_login(config, args.config):
             return
     
+    from auth import WizNoteAuth
+    from api_client import WizNoteAPIClient, create_session
+    
+    # 认证和API请求共用一个HTTP会话，复用连接池
+    session = create_session(dl_cfg['max_concurrent'])
+    
     # 创建认证管理器
-    auth = WizNoteAuth(config)
+    auth = WizNoteAuth(config, session=session)
     
     # 登录
     print("\n正在登录为知笔记...")
@@ -649,15 +1038,17 @@ def main():
     
     print(f"登录成功！用户: {auth.username}")
     
+    # 知识库列表只获取一次，后续复用
+    kb_list = auth.get_kb_list()
+    
     # 列出知识库
     if args.list_kb:
-        list_knowledge_bases(auth)
+        list_knowledge_bases(auth, kb_list)
         return
     
     # 切换知识库
     current_kb_name = '个人笔记'
     if args.kb:
-        kb_list = auth.get_kb_list()
         kb_found = False
         for kb in kb_list:
             if kb['kbGuid'] == args.kb:
@@ -674,103 +1065,94 @@ def main():
     else:
         print(f"\n使用知识库: {current_kb_name}")
     
-    # 创建API客户端
-    api_client = WizNoteAPIClient(auth, config)
-    
-    if args.export_md:
-        export_notes_to_markdown(
-            api_client,
-            args.export_output,
-        )
-        return
-
-    # 列出文件夹
-    if args.list:
-        list_folders(api_client)
-        return
-    
-    # 创建存储管理器
-    storage = LocalStorage(
-        config['download']['output_dir'],
-        config['format']['preserve_structure']
-    )
-    
-    # 创建转换器
-    converter = None
-    if config['format']['convert_to_markdown']:
-        converter = HTMLToMarkdownConverter(config)
-    
-    # 创建下载器
-    downloader = NoteDownloader(api_client, storage, converter)
-    downloader.set_kb_name(current_kb_name)  # 设置知识库名称
-    
-    # 执行备份
-    if args.folders:
-        export_notes_to_markdown(
-            api_client,
-            config['download']['output_dir'],
-            folders_filter=args.folders,
-        )
-        return
-    if args.all:
-        export_notes_to_markdown(
-            api_client,
-            config['download']['output_dir'],
-        )
-        return
-    if args.incremental:
-        print("增量备份功能已弃用，请使用 --all 或 --folders")
-        return
-    else:
-        # 交互式选择
-        print("\n请选择操作：")
-        print("1. 备份所有笔记")
-        print("2. 备份指定文件夹")
-        print("3. 列出所有文件夹")
-        print("0. 退出")
-        
-        choice = input("\n请输入选项 (0-3): ").strip()
+    # 创建API客户端，退出时关闭HTTP会话和响应缓存
+    with WizNoteAPIClient(auth, config, session=session) as api_client:
+        # 增量导出：跳过上次导出后未修改的笔记，--force 时全部重新导出
+        incremental = config['sync']['incremental'] and not args.force
         
-        if choice == '1':
+        if args.export_md:
             export_notes_to_markdown(
                 api_client,
-                config['download']['output_dir'],
+                args.export_output,
+                incremental=incremental,
             )
-        elif choice == '2':
-            folders = api_client.get_all_folders()
-            if not folders:
-                print("未找到任何文件夹。")
-                return
-            
-            print("\n可用的文件夹：")
-            for i, folder in enumerate(folders[:20], 1):  # 只显示前20个
-                print(f"{i}. {folder}")
-            
-            if len(folders) > 20:
-                print(f"... 还有 {len(folders) - 20} 个文件夹")
-            
-            selected = input("\n请输入要备份的文件夹编号（多个用空格分隔）: ").strip()
-            if selected:
-                indices = [int(x) - 1 for x in selected.split()]
-                selected_folders = [folders[i] for i in indices if 0 <= i < len(folders)]
-                if selected_folders:
-                    export_notes_to_markdown(
-                        api_client,
-                        config['download']['output_dir'],
-                        folders_filter=selected_folders,
-                    )
-                else:
-                    print("未选择有效的文件夹。")
-        elif choice == '3':
+            return
+
+        # 列出文件夹
+        if args.list:
             list_folders(api_client)
-        elif choice == '0':
-            print("退出程序。")
+            return
+        
+        # 备份流程统一走 export_notes_to_markdown，无需创建存储管理器、转换器和下载器
+        # 执行备份
+        if args.folders:
+            export_notes_to_markdown(
+                api_client,
+                dl_cfg['output_dir'],
+                folders_filter=args.folders,
+                incremental=incremental,
+            )
+            return
+        if args.all or args.incremental:
+            export_notes_to_markdown(
+                api_client,
+                dl_cfg['output_dir'],
+                incremental=incremental,
+            )
             return
         else:
-            print("无效的选项。")
-    
-    # 清理
-    logger.info("备份任务完成。")
+            # 交互式选择
+            print("\n请选择操作：")
+            print("1. 备份所有笔记")
+            print("2. 备份指定文件夹")
+            print("3. 列出所有文件夹")
+            print("0. 退出")
+            
+            choice = input("\n请输入选项 (0-3): ").strip()
+            
+            if choice == '1':
+                export_notes_to_markdown(
+                    api_client,
+                    dl_cfg['output_dir'],
+                    incremental=incremental,
+                )
+            elif choice == '2':
+                folders = api_client.get_all_folders()
+                if not folders:
+                    print("未找到任何文件夹。")
+                    return
+                
+                print("\n可用的文件夹：")
+                for i, folder in enumerate(folders[:20], 1):  # 只显示前20个
+                    print(f"{i}. {folder}")
+                
+                if len(folders) > 20:
+                    print(f"... 还有 {len(folders) - 20} 个文件夹")
+                
+                selected = input("\n请输入要备份的文件夹编号（多个用空格分隔）: ").strip()
+                if selected:
+                    indices = [int(x) - 1 for x in selected.split()]
+                    selected_folders = [folders[i] for i in indices if 0 <= i < len(folders)]
+                    if selected_folders:
+                        export_notes_to_markdown(
+                            api_client,
+                            dl_cfg['output_dir'],
+                            folders_filter=selected_folders,
+                            folders=folders,
+                            incremental=incremental,
+                        )
+                    else:
+                        print("未选择有效的文件夹。")
+            elif choice == '3':
+                list_folders(api_client)
+            elif choice == '0':
+                print("退出程序。")
+                return
+            else:
+                print("无效的选项。")
+        
+        # 清理
+        logger.info("备份任务完成。")
 
 
 if __name__ == "__main__":
@@ -6,135 +6,455 @@
 """
 
 import os
+import re
 import json
 import time
 import ssl
 import base64
+import shutil
+import threading
 import requests
-from typing import Dict, List, Optional, Generator, Any
-from functools import wraps
+from collections import deque
+from itertools import islice
+from functools import partial
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from email.utils import parsedate_to_datetime
+from requests.utils import get_encoding_from_headers, DEFAULT_ACCEPT_ENCODING
+from typing import Dict, List, Optional, Generator, Any, Callable, Iterable, Iterator, Tuple, Union
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
-import websocket
+from tenacity import (retry, retry_if_exception_type, retry_if_result, stop_after_attempt,
+                      wait_random_exponential)
+from cache import APICache
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# 幂等请求，可安全地自动重试
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD'])
+
+# 服务器过载或暂时不可用、幂等请求可以稍后重试的状态码
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# 自动分页时每页请求的笔记数
+NOTE_PAGE_SIZE = 100
+
+
+# 响应体以 JSON 对象或数组开头（允许前导空白）
+_JSON_BODY_START = re.compile(rb'\s*[\[{]')
+
+
+def _is_json(response: requests.Response) -> bool:
+    """判断响应是否为JSON
+    
+    优先依据 Content-Type；服务器以 text/plain 等类型或不带类型返回JSON时，
+    再检查响应体是否以 { 或 [ 开头。
+    """
+    if 'application/json' in response.headers.get('content-type', ''):
+        return True
+    return _JSON_BODY_START.match(response.content) is not None
 
-def rate_limit(calls_per_second: int = 10):
-    """限流装饰器"""
-    def decorator(func):
-        last_called = [0.0]
-        min_interval = 1.0 / calls_per_second
-        
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            elapsed = time.time() - last_called[0]
-            left_to_wait = min_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            result = func(*args, **kwargs)
-            last_called[0] = time.time()
-            return result
-        return wrapper
-    return decorator
+
+def _loads(data: Union[str, bytes]) -> Any:
+    """解析JSON文本或UTF-8字节，优先使用 orjson；格式错误时抛出 ValueError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj: Any) -> Union[str, bytes]:
+    """序列化为JSON，优先使用 orjson（返回UTF-8字节）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj)
+
+
+def _parse_json(response: requests.Response) -> Any:
+    """解析JSON响应体，优先使用 orjson
+
+    直接解析原始字节，不经过 response.json() 的编码探测
+    """
+    return _loads(response.content)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期），没有或无法解析时返回 None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 指数退避加随机抖动，避免多个线程在同一时刻重试
+_backoff = wait_random_exponential(multiplier=0.5, max=30)
+
+
+def _wait_for_retry(retry_state) -> float:
+    """重试前的等待时间：服务器给出 Retry-After 时以其为准，否则使用 _backoff"""
+    outcome = retry_state.outcome
+    if not outcome.failed:
+        delay = _retry_after(outcome.result())
+        if delay is not None:
+            return delay
+    return _backoff(retry_state)
+
+
+def _release_response(retry_state):
+    """丢弃待重试的响应前将其关闭，流式请求占用的连接才能归还连接池"""
+    outcome = retry_state.outcome
+    if not outcome.failed:
+        outcome.result().close()
+
+
+def _last_outcome(retry_state):
+    """重试耗尽后返回最后一次响应（或抛出最后一次异常），由调用方判断状态码"""
+    return retry_state.outcome.result()
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器
+    
+    每秒补充 rate 个令牌，最多积累 capacity 个；每个HTTP请求消耗一个令牌，
+    令牌不足时等待补充。
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = float(rate)
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """获取一个令牌，必要时阻塞等待
+        
+        在锁内预订令牌（余额可为负，表示已排队的请求），在锁外等待，
+        等待中的线程不会阻塞其他线程计算各自的等待时间。
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def create_session(max_concurrent: int = 1) -> requests.Session:
+    """创建带连接池的HTTP会话
+    
+    连接池不小于并发数；池中连接用尽时等待空闲连接（pool_block），
+    而不是临时新建连接用完即丢，保证并发请求始终复用已建立的TCP/TLS连接。
+    因此流式响应无论读完、丢弃还是出错都必须关闭，否则占用的连接不会归还。
+    
+    连接池本身不重试：重试统一由 WizNoteAPIClient 发起，每次重试都经过限流器，
+    连接错误也不会在两层各重试一遍。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=max(64, max_concurrent),
+        pool_block=True
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # 明确声明接受压缩响应（gzip/deflate，安装 brotli 时还包括 br），由 urllib3 透明解压；
+    # JSON 列表和笔记 HTML 压缩率很高，可大幅减少传输量
+    session.headers['Accept-Encoding'] = DEFAULT_ACCEPT_ENCODING
+    return session
 
 
 class WizNoteAPIClient:
     """为知笔记API客户端"""
     
-    def __init__(self, auth, config: Dict):
+    def __init__(self, auth, config: Dict, session: Optional[requests.Session] = None):
         self.auth = auth
         self.config = config
         self.timeout = config['api']['timeout']
+        
+        # HTTP会话，复用连接池中的TCP/TLS连接
+        self.session = session or create_session(config['download']['max_concurrent'])
         self.rate_limit_per_second = config['api']['rate_limit_per_second']
+        # 所有请求共用一个限流器，在 request() 中每次实际发出请求前获取令牌
+        self.limiter = TokenBucket(self.rate_limit_per_second)
         
         # 从认证信息获取知识库信息
         kb_info = auth.get_kb_info()
         self.kb_guid = kb_info['kb_guid']
         self.kb_server = kb_info['kb_server']
         
-        # 应用限流到所有API方法
-        self._apply_rate_limit()
+        # (token, 认证请求头)：请求头只在 token 变化时重新生成；
+        # 会话与 WizNoteAuth 共用，认证头随每个请求传入，不写到会话上
+        self._auth_state = (None, {})
+        # 多个线程同时发现 token 到期或收到 401 时只由一个线程重新登录
+        self._refresh_lock = threading.Lock()
+        
+        # 预先拼好包含 kb_guid 的接口地址，请求时只需追加笔记/附件GUID
+        base_url = self.kb_server.rstrip('/')
+        self._folders_url = f"{base_url}/ks/category/all/{self.kb_guid}"
+        self._note_list_url = f"{base_url}/ks/note/list/category/{self.kb_guid}"
+        self._note_view_url = f"{base_url}/ks/note/view/{self.kb_guid}/"
+        self._note_download_url = f"{base_url}/ks/note/download/{self.kb_guid}/"
+        self._note_url = f"{base_url}/ks/note/{self.kb_guid}/"
+        self._attachment_url = f"{base_url}/ks/attachment/download/{self.kb_guid}/"
+        
+        # ETag响应缓存（可选）
+        cache_config = config.get('cache', {})
+        self.cache = None
+        if cache_config.get('enabled'):
+            self.cache = APICache(
+                cache_config.get('cache_dir', 'config/cache'),
+                max_age_days=cache_config.get('max_age_days', 30),
+                max_size_mb=cache_config.get('max_size_mb', 200)
+            )
+        
+        # 进程内结果缓存：同一次运行中重复获取的笔记信息和文件夹列表直接返回
+        self._memo_lock = threading.Lock()
+        self._note_info_memo: Dict[str, Dict] = {}
+        self._folders_memo: Optional[List[Dict]] = None
+        
+        # 正在进行中的相同请求，并发调用时只发出一次，其余调用等待结果
+        self._inflight_lock = threading.Lock()
+        self._inflight: Dict[Any, Future] = {}
+        
+        # WebSocket 连接共用一个 SSLContext，不必每次连接都重新加载CA证书
+        self._ws_ssl_context = None
+        ws_config = config.get('websocket', {})
+        if ws_config.get('enabled'):
+            self._ws_ssl_context = ssl.create_default_context()
+            if ws_config.get('skip_tls_verify'):
+                self._ws_ssl_context.check_hostname = False
+                self._ws_ssl_context.verify_mode = ssl.CERT_NONE
+    
+    def close(self):
+        """关闭HTTP会话和响应缓存"""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
-    def _apply_rate_limit(self):
-        """应用限流到所有API方法"""
-        for attr_name in dir(self):
-            attr = getattr(self, attr_name)
-            if callable(attr) and not attr_name.startswith('_') and attr_name != 'request':
-                setattr(self, attr_name, rate_limit(self.rate_limit_per_second)(attr))
+    def _current_auth(self) -> Tuple[Optional[str], Dict[str, str]]:
+        """返回当前的 (token, 认证请求头)；token 即将到期时先刷新，避免等到服务器返回401"""
+        if not self.auth.is_token_valid():
+            with self._refresh_lock:
+                if not self.auth.is_token_valid():
+                    self.auth.refresh_token()
+        state = self._auth_state
+        if state[0] != self.auth.token:
+            state = self._auth_state = (self.auth.token, self.auth.get_headers())
+        return state
+    
+    def _send(self, method: str, url: str, headers: Dict, **kwargs) -> requests.Response:
+        """获取限流令牌后发出单次请求"""
+        self.limiter.acquire()
+        return self.session.request(
+            method,
+            url,
+            headers=headers,
+            timeout=self.timeout,
+            **kwargs
+        )
+    
+    @retry(
+        retry=(retry_if_exception_type((requests.ConnectionError, requests.Timeout))
+               | retry_if_result(lambda response: response.status_code in RETRY_STATUS_CODES)),
+        stop=stop_after_attempt(6),
+        wait=_wait_for_retry,
+        before_sleep=_release_response,
+        retry_error_callback=_last_outcome
+    )
+    def _send_idempotent(self, method: str, url: str, headers: Dict, **kwargs) -> requests.Response:
+        """幂等请求在连接错误、超时和 429/5xx 时重试，每次重试都重新获取限流令牌"""
+        return self._send(method, url, headers, **kwargs)
     
     @retry(
+        retry=retry_if_exception_type(requests.ConnectionError),
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
+        wait=wait_random_exponential(multiplier=1, min=1, max=30),
+        reraise=True
     )
-    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
-        """统一的请求方法，带重试机制"""
+    def _send_with_retry(self, method: str, url: str, headers: Dict, **kwargs) -> requests.Response:
+        """非幂等请求只在连接错误时重试，不因服务器错误状态重复提交"""
+        return self._send(method, url, headers, **kwargs)
+    
+    def request(self, method: str, endpoint: str, use_cache: bool = True,
+                **kwargs) -> requests.Response:
+        """统一的请求方法，带重试机制
+        
+        GET/HEAD 在连接错误、超时和 429/5xx 时重试，其他方法只在连接错误时重试。
+        use_cache 为 False 时不读写响应缓存，用于需要最新结果的请求。
+        """
         # 构建完整URL
         if endpoint.startswith('/'):
             url = f"{self.kb_server}{endpoint}"
         else:
             url = endpoint
             
-        headers = self.auth.get_headers()
+        # 认证请求头在前，调用方传入的请求头可覆盖
+        sent_token, auth_headers = self._current_auth()
+        headers = {**auth_headers, **(kwargs.pop('headers', None) or {})}
         
-        if 'headers' in kwargs:
-            headers.update(kwargs['headers'])
-            kwargs.pop('headers')
+        # GET请求携带ETag/Last-Modified做条件请求，流式下载不走缓存
+        cache_key = None
+        cached = None
+        if use_cache and self.cache is not None and method == 'GET' and not kwargs.get('stream'):
+            cache_key = self._cache_key(url, kwargs.get('params'))
+            cached = self.cache.get(cache_key)
+            if cached:
+                etag, last_modified = cached[0], cached[1]
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
         
-        logger.debug(f"{method} {url}")
+        logger.debug("%s %s", method, url)
         
-        response = requests.request(
-            method,
-            url,
-            headers=headers,
-            timeout=self.timeout,
-            **kwargs
-        )
+        send = self._send_idempotent if method in IDEMPOTENT_METHODS else self._send_with_retry
+        response = send(method, url, headers, **kwargs)
         
         # 检查响应
         if response.status_code == 401:
-            # Token过期，刷新后重试
-            logger.info("Token过期，刷新中...")
-            self.auth.refresh_token()
-            headers = self.auth.get_headers()
-            response = requests.request(
-                method,
-                url,
-                headers=headers,
-                timeout=self.timeout,
-                **kwargs
-            )
+            # Token过期，刷新后重试；其他线程已用新 token 替换时直接重发
+            with self._refresh_lock:
+                if self.auth.token == sent_token:
+                    logger.info("Token过期，刷新中...")
+                    self.auth.refresh_token(force=True)
+            headers.update(self._current_auth()[1])
+            # 丢弃的响应先关闭，流式请求占用的连接才能归还连接池
+            response.close()
+            response = send(method, url, headers, **kwargs)
         
-        response.raise_for_status()
+        if cache_key is not None:
+            if response.status_code == 304 and cached:
+                # 内容未变化，使用缓存的响应体
+                self._restore_cached_response(response, cached)
+            elif response.status_code == 200 and (
+                    'ETag' in response.headers or 'Last-Modified' in response.headers):
+                self.cache.put(
+                    cache_key,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                    response.headers.get('content-type', ''),
+                    response.content
+                )
+        
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            # 调用方拿不到这个响应，在此关闭以归还连接（pool_block 下泄漏的连接会让后续请求一直等待）
+            response.close()
+            raise
         return response
     
+    @staticmethod
+    def _cache_key(url: str, params: Optional[Dict] = None) -> str:
+        """生成缓存键（URL + 排序后的查询参数）"""
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted(params.items()))}"
+    
+    @staticmethod
+    def _restore_cached_response(response: requests.Response, cached: tuple):
+        """用缓存内容填充 304 响应，调用方按 200 响应处理"""
+        etag, last_modified, content_type, body = cached
+        response.status_code = 200
+        response._content = body
+        if content_type:
+            response.headers['Content-Type'] = content_type
+        response.encoding = get_encoding_from_headers(response.headers)
+    
+    def _single_flight(self, key, func, *args):
+        """合并并发的相同请求：同一 key 同时只执行一次 func，其余调用方共享其结果"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+    
     def get_all_folders(self) -> List[Dict]:
+        """获取所有文件夹（同一客户端内只请求一次）"""
+        with self._memo_lock:
+            folders = self._folders_memo
+        if folders is None:
+            folders = self._single_flight('folders', self._load_all_folders)
+        return list(folders)
+    
+    def _load_all_folders(self) -> List[Dict]:
+        """请求文件夹列表并写入缓存（由 _single_flight 保证同时只执行一次）"""
+        with self._memo_lock:
+            if self._folders_memo is not None:
+                return self._folders_memo
+        folders = self._fetch_all_folders()
+        if folders:
+            with self._memo_lock:
+                self._folders_memo = folders
+        return folders
+    
+    def _fetch_all_folders(self) -> List[Dict]:
         """获取所有文件夹
         
         官方API: GET /ks/category/all/:kbGuid
         """
-        response = self.request('GET', f'/ks/category/all/{self.kb_guid}')
+        response = self.request('GET', self._folders_url)
         
         if response.status_code == 200:
+            if not _is_json(response):
+                logger.error("文件夹响应不是JSON，内容类型: %s", response.headers.get('content-type', ''))
+                return []
             try:
-                result = response.json()
-                logger.info(f"文件夹响应: {result}")
+                result = _parse_json(response)
+                logger.debug("文件夹响应: %s", result)
                 if isinstance(result, list):
-                    logger.info(f"获取到 {len(result)} 个文件夹")
+                    logger.info("获取到 %s 个文件夹", len(result))
                     return result
                 elif isinstance(result, dict) and result.get('returnCode') == 200:
                     folders = result.get('result', [])
-                    logger.info(f"获取到 {len(folders)} 个文件夹")
+                    logger.info("获取到 %s 个文件夹", len(folders))
                     return folders
             except Exception as e:
-                logger.error(f"解析文件夹响应失败: {e}")
+                logger.error("解析文件夹响应失败: %s", e)
         
         return []
     
     def get_notes_in_folder(self, folder_path: str = "/", 
                            start: int = 0, count: int = 100,
                            order_by: str = "modified",
-                           ascending: str = "desc") -> Dict:
+                           ascending: str = "desc",
+                           with_abstract: bool = True) -> Dict:
         """获取文件夹中的笔记列表
         
         官方API: GET /ks/note/list/category/:kbGuid
@@ -152,14 +472,17 @@ class WizNoteAPIClient:
             "count": count,
             "orderBy": order_by,
             "ascending": ascending,
-            "withAbstract": "true"
+            "withAbstract": "true" if with_abstract else "false"
         }
         
-        response = self.request('GET', f'/ks/note/list/category/{self.kb_guid}', params=params)
+        response = self.request('GET', self._note_list_url, params=params)
         
         if response.status_code == 200:
+            if not _is_json(response):
+                logger.error("笔记列表响应不是JSON，内容类型: %s", response.headers.get('content-type', ''))
+                return {'notes': [], 'total': 0}
             try:
-                result = response.json()
+                result = _parse_json(response)
                 # 返回格式可能是直接的数组或包含returnCode的对象
                 if isinstance(result, list):
                     return {
@@ -171,72 +494,181 @@ class WizNoteAPIClient:
                         notes = result.get('result', [])
                         return {
                             'notes': notes,
-                            'total': result.get('total', len(notes))
+                            'total': result.get('total', len(notes)),
+                            # 服务器是否给出了文件夹的笔记总数
+                            'total_known': 'total' in result
                         }
                     else:
-                        logger.error(f"获取笔记列表失败: {result.get('returnMessage')}")
+                        logger.error("获取笔记列表失败: %s", result.get('returnMessage'))
             except Exception as e:
-                logger.error(f"解析笔记列表响应失败: {e}")
+                logger.error("解析笔记列表响应失败: %s", e)
         
         return {'notes': [], 'total': 0}
     
-    def get_all_notes_in_folder(self, folder_path: str = "/") -> Generator[Dict, None, None]:
-        """获取文件夹中的所有笔记（自动分页）"""
-        start = 0
-        count = 100
+    def get_all_notes_in_folder(self, folder_path: str = "/",
+                                prefetch: int = 4, start: int = 0,
+                                page_size: int = NOTE_PAGE_SIZE,
+                                with_abstract: bool = True) -> Generator[Dict, None, None]:
+        """获取文件夹中的所有笔记（自动分页）
+        
+        start 为起始偏移；不需要摘要时 with_abstract=False 可减小每页的数据量。
+        其余页的请求方式见 _iter_note_pages。
+        """
+        fetch = partial(self.get_notes_in_folder, folder_path, with_abstract=with_abstract)
+        first_page = fetch(start, page_size)
+        yield from self._iter_note_pages(fetch, first_page, start, page_size, prefetch)
+    
+    def _iter_note_pages(self, fetch: Callable[[int, int], Dict], first_page: Dict, start: int,
+                         page_size: int, max_workers: int = 4) -> Generator[Dict, None, None]:
+        """从已获取的第一页开始按顺序返回文件夹中的笔记
+        
+        fetch(start, count) 获取一页。服务器给出笔记总数时，按总数并发请求其余各页，
+        同时在途的页数不超过 max_workers 的两倍，每取回一页再补充一页；
+        没有总数时，后台预取后续 max_workers 页。
+        到达总数后若最后一页仍是满的，继续逐页请求直到不满一页为止。
+        """
+        count = page_size
+        notes = first_page['notes']
+        yield from notes
+        
+        next_start = start + len(notes)
+        fan_out = first_page.get('total_known', False)
+        total = first_page.get('total') or 0
+        if fan_out and 0 < len(notes) < count and next_start < total:
+            # 服务器限制了每页的最大数量，按实际返回的数量继续分页
+            count = len(notes)
+        if len(notes) < count:
+            return
         
-        while True:
-            result = self.get_notes_in_folder(folder_path, start, count)
-            notes = result['notes']
+        pending = deque()
+        # 在途页数上限，大文件夹也不会一次提交全部页
+        window = max_workers * 2 if fan_out else max_workers
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def submit_page():
+                nonlocal next_start
+                pending.append(executor.submit(fetch, next_start, count))
+                next_start += count
             
-            if not notes:
-                break
+            def fill():
+                """补足在途的页；按总数分页时只请求总数以内的页，都已取完仍需继续时逐页请求"""
+                while len(pending) < window and (not fan_out or next_start < total):
+                    submit_page()
+                if not pending:
+                    submit_page()
             
-            for note in notes:
-                yield note
+            fill()
             
-            start += len(notes)
+            try:
+                while pending:
+                    notes = pending.popleft().result()['notes']
+                    
+                    if not notes:
+                        break
+                    
+                    yield from notes
+                    
+                    # 如果返回的笔记数少于请求数，说明已经到最后一页
+                    if len(notes) < count:
+                        break
+                    
+                    fill()
+            finally:
+                # 已到末页或调用方提前结束时，取消尚未开始的请求
+                for future in pending:
+                    future.cancel()
+    
+    def walk_kb(self, folder_paths: Iterable[str], concurrency: int = 4,
+                page_size: int = NOTE_PAGE_SIZE,
+                with_abstract: bool = True) -> Generator[Tuple[str, Iterator[Dict]], None, None]:
+        """按给定顺序遍历文件夹，依次返回 (文件夹路径, 该文件夹的笔记迭代器)
+        
+        后续 concurrency 个文件夹的第一页笔记列表提前并发请求，
+        文件夹之间不再逐个等待列表请求；其余页由笔记迭代器继续获取。
+        """
+        paths = iter(folder_paths)
+        pending = deque()
+        
+        def submit_folder(executor: ThreadPoolExecutor, folder_path: str):
+            fetch = partial(self.get_notes_in_folder, folder_path, with_abstract=with_abstract)
+            pending.append((folder_path, fetch, executor.submit(fetch, 0, page_size)))
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for folder_path in islice(paths, concurrency):
+                submit_folder(executor, folder_path)
             
-            # 如果返回的笔记数少于请求数，说明已经到最后一页
-            if len(notes) < count:
-                break
+            try:
+                while pending:
+                    folder_path, fetch, future = pending.popleft()
+                    next_path = next(paths, None)
+                    if next_path is not None:
+                        submit_folder(executor, next_path)
+                    yield folder_path, self._iter_note_pages(fetch, future.result(), 0, page_size)
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
     
     def get_note_info(self, doc_guid: str) -> Optional[Dict]:
+        """获取笔记信息（同一客户端内每篇笔记只请求一次）"""
+        with self._memo_lock:
+            info = self._note_info_memo.get(doc_guid)
+        if info is None:
+            info = self._single_flight(('note_info', doc_guid), self._load_note_info, doc_guid)
+        return info
+    
+    def _load_note_info(self, doc_guid: str) -> Optional[Dict]:
+        """请求笔记信息并写入缓存（由 _single_flight 保证同一笔记同时只执行一次）"""
+        with self._memo_lock:
+            info = self._note_info_memo.get(doc_guid)
+        if info is None:
+            info = self._fetch_note_info(doc_guid)
+            if info is not None:
+                with self._memo_lock:
+                    self._note_info_memo[doc_guid] = info
+        return info
+    
+    def _fetch_note_info(self, doc_guid: str) -> Optional[Dict]:
         """获取笔记信息
         
         官方API: GET /ks/note/view/:kbGuid/:docGuid/
         """
         try:
-            response = self.request('GET', f'/ks/note/view/{self.kb_guid}/{doc_guid}/')
+            response = self.request('GET', self._note_view_url + doc_guid + '/')
             
             if response.status_code == 200:
                 # 检查响应内容
-                content_type = response.headers.get('content-type', '')
-                
-                if 'application/json' in content_type:
+                if _is_json(response):
                     try:
-                        result = response.json()
+                        result = _parse_json(response)
                         if isinstance(result, dict):
                             if result.get('returnCode') == 200:
                                 return result.get('result')
                             else:
-                                logger.error(f"获取笔记信息失败: {result.get('returnMessage')}")
+                                logger.error("获取笔记信息失败: %s", result.get('returnMessage'))
                         else:
                             # 可能直接返回笔记信息
                             return result
                     except Exception as e:
-                        logger.error(f"解析笔记信息响应失败: {e}")
+                        logger.error("解析笔记信息响应失败: %s", e)
                 else:
                     # 可能是HTML内容
-                    logger.debug(f"获取到非JSON响应，内容类型: {content_type}")
+                    logger.debug("获取到非JSON响应，内容类型: %s", response.headers.get('content-type', ''))
                     return None
         except Exception as e:
-            logger.error(f"获取笔记信息异常: {e}")
+            logger.error("获取笔记信息异常: %s", e)
         
         return None
     
     def download_note(self, doc_guid: str, download_info: bool = True, 
                      download_data: bool = True) -> Optional[Dict]:
+        """下载笔记内容，并发下载同一笔记时只发出一次请求"""
+        return self._single_flight(
+            ('download', doc_guid, download_info, download_data),
+            self._download_note, doc_guid, download_info, download_data
+        )
+    
+    def _download_note(self, doc_guid: str, download_info: bool,
+                       download_data: bool) -> Optional[Dict]:
         """下载笔记内容
         
         官方API: GET /ks/note/download/:kbGuid/:docGuid
@@ -249,16 +681,14 @@ class WizNoteAPIClient:
             "downloadData": 1 if download_data else 0
         }
         
-        response = self.request('GET', f'/ks/note/download/{self.kb_guid}/{doc_guid}', params=params)
+        response = self.request('GET', self._note_download_url + doc_guid, params=params)
         
         if response.status_code == 200:
             # 检查响应类型
-            content_type = response.headers.get('content-type', '')
-            
-            if 'application/json' in content_type:
+            if _is_json(response):
                 # JSON响应，包含笔记信息和内容
                 try:
-                    result = response.json()
+                    result = _parse_json(response)
                     if isinstance(result, dict) and result.get('returnCode') == 200:
                         # 返回笔记数据，兼容不同结构
                         if 'result' in result:
@@ -267,7 +697,7 @@ class WizNoteAPIClient:
                             return result
                     return result
                 except Exception as e:
-                    logger.error(f"解析笔记下载响应失败: {e}")
+                    logger.error("解析笔记下载响应失败: %s", e)
             else:
                 # 可能是HTML内容
                 return {
@@ -283,23 +713,23 @@ class WizNoteAPIClient:
         通过 POST /ks/note/{kbGuid}/{docGuid}/tokens 获取编辑器专用信息
         返回包含 editorToken, editorPermission, userId, displayName, avatarUrl 等信息
         """
-        endpoint = f'/ks/note/{self.kb_guid}/{doc_guid}/tokens'
+        endpoint = self._note_url + doc_guid + '/tokens'
         
         try:
             response = self.request('POST', endpoint)
             if response.status_code == 200:
-                result = response.json()
+                result = _parse_json(response)
                 if isinstance(result, dict) and result.get('returnCode') == 200:
                     editor_info = result.get('result', {})
                     if editor_info.get('editorToken'):
-                        logger.debug(f"成功获取编辑器 token 信息")
+                        logger.debug("成功获取编辑器 token 信息")
                         return editor_info
                     else:
-                        logger.warning(f"响应中没有 editorToken: {result}")
+                        logger.warning("响应中没有 editorToken: %s", result)
                 else:
-                    logger.warning(f"获取编辑器 token 失败: {result}")
+                    logger.warning("获取编辑器 token 失败: %s", result)
         except Exception as e:
-            logger.error(f"获取编辑器 token 异常: {e}")
+            logger.error("获取编辑器 token 异常: %s", e)
         
         return None
 
@@ -310,15 +740,18 @@ class WizNoteAPIClient:
             logger.warning("WebSocket 功能未启用，请在配置中设置 websocket.enabled 为 true")
             return None
 
+        # websocket-client 只在实际使用 WebSocket API 时才导入
+        import websocket
+
         url_template = ws_config.get('url_template') or "wss://wiz.frp.linyanli.cn/editor/{kbGuid}/{docGuid}"
         ws_url = url_template.format(kbGuid=self.kb_guid, docGuid=doc_guid)
-        logger.debug(f"WebSocket URL: {ws_url}")
+        logger.debug("WebSocket URL: %s", ws_url)
         
         # 获取编辑器信息
         # 优先使用配置中的 editor_token
         editor_token_config = ws_config.get('editor_token', '').strip()
         if editor_token_config:
-            logger.debug(f"使用配置中的 editor_token: {editor_token_config[:20]}...")
+            logger.debug("使用配置中的 editor_token: %s...", editor_token_config[:20])
             token = editor_token_config
             # 使用已有的用户信息
             user_id = self.auth.user_guid
@@ -343,7 +776,7 @@ class WizNoteAPIClient:
                 logger.error("编辑器信息中没有 token")
                 return None
             
-            logger.debug(f"获取到 editor token: {token[:20]}...")
+            logger.debug("获取到 editor token: %s...", token[:20])
         
         headers = {
             "Origin": ws_config.get('origin', self.kb_server),
@@ -357,7 +790,7 @@ class WizNoteAPIClient:
         cookies = ws_config.get('cookies')
         if cookies:
             headers["Cookie"] = cookies
-            logger.debug(f"使用 Cookie: {cookies[:50]}..." if len(cookies) > 50 else f"使用 Cookie: {cookies}")
+            logger.debug("使用 Cookie: %s", cookies[:50] + '...' if len(cookies) > 50 else cookies)
 
         additional = ws_config.get('additional_headers') or {}
         for key, value in additional.items():
@@ -366,21 +799,17 @@ class WizNoteAPIClient:
 
         header_list = [f"{key}: {value}" for key, value in headers.items() if value]
 
-        sslopt = {}
-        if ws_config.get('skip_tls_verify'):
-            sslopt = {"cert_reqs": ssl.CERT_NONE}
-
         try:
-            logger.debug(f"正在连接 WebSocket: {ws_url}")
+            logger.debug("正在连接 WebSocket: %s", ws_url)
             ws = websocket.create_connection(
                 ws_url,
                 header=header_list,
                 timeout=ws_config.get('connect_timeout', 10),
-                sslopt=sslopt or None,
+                sslopt={"context": self._ws_ssl_context},
             )
             logger.debug("WebSocket 连接成功")
         except Exception as e:
-            logger.error(f"建立 WebSocket 连接失败: {e}")
+            logger.error("建立 WebSocket 连接失败: %s", e)
             return None
 
         # 准备握手消息
@@ -399,8 +828,9 @@ class WizNoteAPIClient:
         }
         
         # 连接后立即发送第一次握手
-        logger.debug(f"发送第一次握手消息 (token: {token[:20]}...)")
-        ws.send(json.dumps(handshake_msg))
+        logger.debug("发送第一次握手消息 (token: %s...)", token[:20])
+        handshake_data = _dumps(handshake_msg)
+        ws.send(handshake_data)
 
         init_payload = ws_config.get('init_payload')
         if init_payload:
@@ -409,19 +839,19 @@ class WizNoteAPIClient:
             if encoding == 'hex':
                 try:
                     payload_bytes = bytes.fromhex(init_payload.replace(' ', ''))
-                    logger.debug(f"发送 hex init_payload: {len(payload_bytes)} bytes")
+                    logger.debug("发送 hex init_payload: %s bytes", len(payload_bytes))
                 except ValueError as exc:
-                    logger.error(f"init_payload hex 解析失败: {exc}")
+                    logger.error("init_payload hex 解析失败: %s", exc)
             elif encoding == 'base64':
                 try:
                     payload_bytes = base64.b64decode(init_payload)
-                    logger.debug(f"发送 base64 init_payload: {len(payload_bytes)} bytes")
+                    logger.debug("发送 base64 init_payload: %s bytes", len(payload_bytes))
                 except Exception as exc:
-                    logger.error(f"init_payload base64 解析失败: {exc}")
+                    logger.error("init_payload base64 解析失败: %s", exc)
             if payload_bytes is not None:
                 ws.send(payload_bytes, opcode=websocket.ABNF.OPCODE_BINARY)
             else:
-                logger.debug(f"发送 text init_payload: {init_payload[:100]}...")
+                logger.debug("发送 text init_payload: %s...", init_payload[:100])
                 ws.send(init_payload)
 
         ws.settimeout(ws_config.get('message_timeout', 10))
@@ -437,39 +867,39 @@ class WizNoteAPIClient:
                     message = ws.recv()
                     message_count += 1
                 except websocket.WebSocketTimeoutException:
-                    logger.debug(f"WebSocket 超时，共接收 {message_count} 条消息")
+                    logger.debug("WebSocket 超时，共接收 %s 条消息", message_count)
                     break
                 except websocket.WebSocketConnectionClosedException:
-                    logger.debug(f"WebSocket 连接关闭，共接收 {message_count} 条消息")
+                    logger.debug("WebSocket 连接关闭，共接收 %s 条消息", message_count)
                     break
 
                 if not message:
                     continue
 
-                if isinstance(message, bytes):
-                    try:
-                        message = message.decode('utf-8')
-                    except UnicodeDecodeError:
-                        logger.debug(f"消息 #{message_count}: 无法解码的二进制数据")
-                        continue
-
+                # 文本和二进制消息都直接解析，无法解码的二进制数据同样按非JSON处理
                 try:
-                    payload = json.loads(message)
-                    logger.debug(f"消息 #{message_count}: {json.dumps(payload, ensure_ascii=False)[:200]}...")
-                except json.JSONDecodeError:
-                    logger.debug(f"消息 #{message_count}: 非JSON数据: {message[:200]}...")
+                    payload = _loads(message)
+                except ValueError:
+                    # 二进制消息用 repr 显示前 200 字节，不把 bytes 当作字符串截断
+                    logger.debug("消息 #%s: 非JSON数据: %r...", message_count, message[:200])
                     continue
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("消息 #%s: %.200s...", message_count,
+                                 json.dumps(payload, ensure_ascii=False))
 
                 # 记录所有消息类型
                 msg_type = payload.get('a')
-                logger.debug(f"消息类型: {msg_type}")
+                logger.debug("消息类型: %s", msg_type)
 
                 # 收到 init 消息后,再次发送握手
                 if msg_type == 'init' and not handshake_sent:
                     session_id = payload.get('id')
-                    logger.debug(f"收到 init 消息，session_id: {session_id}")
-                    logger.debug(f"发送第二次握手消息: {json.dumps({**handshake_msg, 'auth': {**handshake_msg['auth'], 'token': token[:20] + '...'}}, ensure_ascii=False)}")
-                    ws.send(json.dumps(handshake_msg))
+                    logger.debug("收到 init 消息，session_id: %s", session_id)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        # 日志中的 token 只保留前缀
+                        redacted_msg = {**handshake_msg, 'auth': {**handshake_msg['auth'], 'token': token[:20] + '...'}}
+                        logger.debug("发送第二次握手消息: %s", json.dumps(redacted_msg, ensure_ascii=False))
+                    ws.send(handshake_data)
                     handshake_sent = True
                     continue
 
@@ -479,21 +909,21 @@ class WizNoteAPIClient:
                     
                     # 发送获取文档数据的请求
                     f_request = {"a": "f", "c": self.kb_guid, "d": doc_guid}
-                    logger.debug(f"发送 f 请求获取文档数据: {json.dumps(f_request, ensure_ascii=False)}")
-                    ws.send(json.dumps(f_request))
+                    logger.debug("发送 f 请求获取文档数据: %s", f_request)
+                    ws.send(_dumps(f_request))
                     continue
 
                 # 处理文档数据消息
                 if msg_type == 'f' and 'data' in payload:
                     note_payload = payload.get('data')
-                    logger.info(f"成功获取笔记数据 (消息 #{message_count})")
+                    logger.info("成功获取笔记数据 (消息 #%s)", message_count)
                     break
         finally:
             ws.close()
-            logger.debug(f"WebSocket 连接已关闭，共处理 {message_count} 条消息")
+            logger.debug("WebSocket 连接已关闭，共处理 %s 条消息", message_count)
 
         if note_payload is None:
-            logger.warning(f"未通过 WebSocket 获取到笔记数据: {doc_guid} (共接收 {message_count} 条消息)")
+            logger.warning("未通过 WebSocket 获取到笔记数据: %s (共接收 %s 条消息)", doc_guid, message_count)
             return None
 
         return note_payload
@@ -523,49 +953,39 @@ class WizNoteAPIClient:
         
         return []
     
-    def download_attachment(self, doc_guid: str, att_guid: str) -> Optional[bytes]:
-        """下载附件
-        
-        官方API: GET /ks/attachment/download/:kbGuid/:docGuid/:attGuid
-        """
-        response = self.request(
-            'GET', 
-            f'/ks/attachment/download/{self.kb_guid}/{doc_guid}/{att_guid}',
-            stream=True
-        )
+    def download_attachment_to_file(self, doc_guid: str, att_guid: str, path) -> Optional[int]:
+        """下载附件并直接写入文件，内存占用与附件大小无关
         
-        if response.status_code == 200:
-            # 流式下载大文件
-            chunks = []
-            for chunk in response.iter_content(chunk_size=self.config['download']['chunk_size']):
-                if chunk:
-                    chunks.append(chunk)
-            return b''.join(chunks)
-        else:
-            logger.error(f"下载附件失败: HTTP {response.status_code}")
-            return None
-    
-    def create_folder(self, parent_folder: str, folder_name: str) -> bool:
-        """创建文件夹
+        先写入临时文件，完成后再替换为目标文件，中断时不会留下残缺的附件。
         
-        官方API: POST /ks/category/create/:kbGuid
+        Returns:
+            写入的字节数，失败时返回 None
         """
-        data = {
-            "parent": parent_folder,
-            "name": folder_name
-        }
-        
-        response = self.request('POST', f'/ks/category/create/{self.kb_guid}', json=data)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('returnCode') == 200:
-                logger.info(f"创建文件夹成功: {parent_folder}/{folder_name}")
-                return True
-            else:
-                logger.error(f"创建文件夹失败: {result.get('returnMessage')}")
+        with self.request(
+            'GET',
+            f'{self._attachment_url}{doc_guid}/{att_guid}',
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error("下载附件失败: HTTP %s", response.status_code)
+                return None
+            
+            # 由 urllib3 解压 gzip/deflate 传输编码后再写入
+            response.raw.decode_content = True
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, self.config['download']['chunk_size'])
+                    size = f.tell()
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
         
-        return False
+        return size
 
 
 if __name__ == "__main__":
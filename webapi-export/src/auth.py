@@ -22,8 +22,9 @@ logger = logging.getLogger(__name__)
 class WizNoteAuth:
     """为知笔记认证管理器"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, session: Optional[requests.Session] = None):
         self.config = config
+        self.session = session or requests.Session()
         self.as_url = config['api']['as_url']  # Account Server URL
         self.username = config['auth']['username']
         self.password = config['auth']['password']
@@ -132,7 +133,7 @@ class WizNoteAuth:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 login_url,
                 json=login_data,
                 timeout=self.config['api']['timeout']
@@ -211,7 +212,7 @@ class WizNoteAuth:
                 }
                 
                 logger.debug(f"获取团队列表: {biz_url}")
-                response = requests.get(
+                response = self.session.get(
                     biz_url,
                     headers=headers,
                     timeout=self.config['api']['timeout']
@@ -230,7 +231,7 @@ class WizNoteAuth:
                             
                             # 获取该biz的知识库
                             kb_url = f"{self.as_url}/as/biz/user_kb_list?bizGuid={biz_guid}"
-                            kb_response = requests.get(
+                            kb_response = self.session.get(
                                 kb_url,
                                 headers=headers,  # 使用同样的headers
                                 timeout=self.config['api']['timeout']
@@ -256,10 +257,13 @@ class WizNoteAuth:
         except Exception as e:
             logger.error(f"获取知识库列表失败: {e}")
     
-    def refresh_token(self) -> bool:
-        """刷新Token"""
+    def refresh_token(self, force: bool = False) -> bool:
+        """刷新Token
+        
+        force 为 True 时即使Token未到期也重新登录（如服务器已返回401）
+        """
         # 如果Token还有效，不需要刷新
-        if self.is_token_valid():
+        if not force and self.is_token_valid():
             return True
         
         # 重新登录
@@ -293,8 +297,13 @@ class WizNoteAuth:
             'user_guid': self.user_guid
         }
     
-    def get_kb_list(self) -> List[Dict]:
-        """获取所有知识库列表"""
+    def get_kb_list(self, refresh: bool = False) -> List[Dict]:
+        """获取所有知识库列表
+        
+        知识库列表在登录时已获取并缓存，refresh=True 时重新从服务器获取
+        """
+        if refresh:
+            self._get_kb_list()
         return self.kb_list
     
     def switch_kb(self, kb_guid: str) -> bool:
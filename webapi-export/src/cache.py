@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API响应缓存和笔记导出索引模块
+基于 ETag / Last-Modified 的条件请求缓存，以及增量导出用的笔记索引，均持久化到本地 SQLite
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class APICache:
+    """基于ETag/Last-Modified的API响应缓存
+    
+    写入超过 max_age_days 天的条目在打开缓存时删除；响应体总大小超过 max_size_mb 时，
+    从最早写入的条目开始删除，直到降到上限的 90%。单个超过上限的响应不缓存。
+    """
+    
+    def __init__(self, cache_dir: str, max_age_days: float = 30, max_size_mb: float = 200):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'api_cache.db')
+        self.max_age = max_age_days * 86400
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        
+        # 多个下载线程共用一个连接，读写由锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, "
+            "etag TEXT NOT NULL, "
+            "content_type TEXT, "
+            "body BLOB NOT NULL, "
+            "last_modified TEXT, "
+            "stored_at REAL)"
+        )
+        # 兼容旧版本创建的缓存库（没有 last_modified、stored_at 列）；
+        # 旧条目的写入时间未知，按已过期处理
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if 'last_modified' not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN last_modified TEXT")
+        if 'stored_at' not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN stored_at REAL")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+        self._conn.execute(
+            "DELETE FROM responses WHERE stored_at IS NULL OR stored_at < ?",
+            (time.time() - self.max_age,)
+        )
+        # 缓存中响应体的总字节数，写入时增量维护，不必每次重新统计
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()[0]
+        if self._size > self.max_size:
+            self._evict()
+        self._conn.commit()
+    
+    def _evict(self):
+        """从最早写入的条目开始删除，直到总大小降到上限的 90%（调用方持有锁或尚未共享连接）"""
+        target = self.max_size * 0.9
+        doomed = []
+        for url, size in self._conn.execute(
+                "SELECT url, LENGTH(body) FROM responses ORDER BY stored_at"):
+            if self._size <= target:
+                break
+            doomed.append((url,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+        logger.debug("响应缓存超过上限，删除 %s 个最早的条目", len(doomed))
+    
+    def get(self, url: str) -> Optional[Tuple[str, Optional[str], str, bytes]]:
+        """获取缓存的响应
+        
+        Returns:
+            (etag, last_modified, content_type, body)，未命中时返回 None；
+            服务器没有返回 ETag 时 etag 为空字符串
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_type, body FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+        return row
+    
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str],
+            content_type: str, body: bytes):
+        """保存响应到缓存，超过总大小上限时淘汰最早的条目"""
+        if len(body) > self.max_size:
+            return
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT LENGTH(body) FROM responses WHERE url = ?", (url,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(url, etag, last_modified, content_type, body, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, etag or '', last_modified, content_type, body, time.time())
+                )
+                self._size += len(body) - (row[0] if row else 0)
+                if self._size > self.max_size:
+                    self._evict()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入响应缓存失败: {e}")
+    
+    def close(self):
+        """关闭缓存数据库"""
+        with self._lock:
+            self._conn.close()
+
+
+class NoteIndex:
+    """笔记导出索引
+    
+    记录每篇笔记上次成功导出时的修改时间、版本号和输出文件（相对导出目录的路径），
+    再次导出时与笔记列表中的对应字段比较，未变化的笔记无需重新下载。
+    同名笔记的文件名按记录沿用，不随笔记列表的顺序变化而互换。只在单个线程中写入。
+    """
+    
+    # 每记录这么多篇笔记提交一次事务
+    COMMIT_INTERVAL = 500
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "doc_guid TEXT PRIMARY KEY, "
+            "modified TEXT, "
+            "version TEXT, "
+            "filename TEXT)"
+        )
+        # 兼容旧版本创建的索引（没有 filename 列），这些笔记会重新导出一次并补上文件名
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(notes)")}
+        if 'filename' not in columns:
+            self._conn.execute("ALTER TABLE notes ADD COLUMN filename TEXT")
+        self._conn.commit()
+        # 一次性载入全部记录，逐篇比较时不再查询数据库
+        self._stamps: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._files: Dict[str, str] = {}
+        # 目录 -> {doc_guid: 文件名 stem}
+        self._dirs: Dict[str, Dict[str, str]] = {}
+        for doc_guid, modified, version, filename in self._conn.execute(
+                "SELECT doc_guid, modified, version, filename FROM notes"):
+            self._stamps[doc_guid] = (modified, version)
+            if filename:
+                self._add_file(doc_guid, filename)
+        self._uncommitted = 0
+    
+    @staticmethod
+    def _stamp(note: Dict) -> Tuple[Optional[str], Optional[str]]:
+        """笔记列表项中的 (修改时间, 版本号)，统一转为字符串比较"""
+        modified = note.get('modified')
+        version = note.get('version')
+        return (
+            None if modified is None else str(modified),
+            None if version is None else str(version)
+        )
+    
+    def _add_file(self, doc_guid: str, filename: str):
+        """登记笔记的输出文件，同时从它原来所在目录的记录中移除"""
+        old = self._files.get(doc_guid)
+        if old is not None:
+            old_dir = old.rpartition('/')[0]
+            self._dirs.get(old_dir, {}).pop(doc_guid, None)
+        self._files[doc_guid] = filename
+        directory, _, name = filename.rpartition('/')
+        self._dirs.setdefault(directory, {})[doc_guid] = os.path.splitext(name)[0]
+    
+    def filename(self, doc_guid: str) -> Optional[str]:
+        """笔记上次导出的文件（相对导出目录的 POSIX 路径），没有记录时返回 None"""
+        return self._files.get(doc_guid)
+    
+    def stems_in(self, directory: str) -> Dict[str, str]:
+        """目录（相对导出目录的 POSIX 路径，根目录为空字符串）中已记录的 {doc_guid: 文件名 stem}"""
+        return dict(self._dirs.get(directory, {}))
+    
+    def is_unchanged(self, note: Dict) -> bool:
+        """笔记自上次导出后是否未变化；列表项中没有修改时间和版本号时视为已变化"""
+        stamp = self._stamp(note)
+        if stamp == (None, None):
+            return False
+        return self._stamps.get(note.get('docGuid')) == stamp
+    
+    def record(self, note: Dict, filename: str):
+        """记录笔记已成功导出到 filename（相对导出目录的 POSIX 路径）"""
+        doc_guid = note.get('docGuid')
+        if not doc_guid:
+            return
+        stamp = self._stamp(note)
+        self._stamps[doc_guid] = stamp
+        self._add_file(doc_guid, filename)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO notes (doc_guid, modified, version, filename) VALUES (?, ?, ?, ?)",
+            (doc_guid, *stamp, filename)
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_INTERVAL:
+            self._conn.commit()
+            self._uncommitted = 0
+    
+    def close(self):
+        """提交未保存的记录并关闭数据库"""
+        self._conn.commit()
+        self._conn.close()
@@ -12,10 +12,15 @@ import html2text
 from typing import Dict, List, Tuple, Optional
 from bs4 import BeautifulSoup
 import base64
+import hashlib
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# 转换过程中用到的正则，模块加载时编译一次
+_DATA_URI_RE = re.compile(r'data:image/(\w+);base64,(.+)')
+_EXTRA_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
 
 class HTMLToMarkdownConverter:
     """HTML到Markdown转换器"""
@@ -144,7 +149,7 @@ class HTMLToMarkdownConverter:
         """提取base64编码的图片"""
         try:
             # 解析data URI
-            match = re.match(r'data:image/(\w+);base64,(.+)', data_uri)
+            match = _DATA_URI_RE.match(data_uri)
             if not match:
                 return None
             
@@ -155,7 +160,6 @@ class HTMLToMarkdownConverter:
             image_data = base64.b64decode(base64_data)
             
             # 生成文件名
-            import hashlib
             hash_md5 = hashlib.md5(image_data).hexdigest()[:8]
             filename = f"image_{hash_md5}.{image_type}"
             
@@ -173,11 +177,11 @@ class HTMLToMarkdownConverter:
     def _postprocess_markdown(self, markdown_content: str) -> str:
         """后处理Markdown内容"""
         # 清理多余的空行
-        markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
+        markdown_content = _EXTRA_BLANK_LINES_RE.sub('\n\n', markdown_content)
         
-        # 修复代码块格式
-        markdown_content = re.sub(r'```\n\n', '```\n', markdown_content)
-        markdown_content = re.sub(r'\n\n```', '\n```', markdown_content)
+        # 修复代码块格式（固定字符串，无需正则）
+        markdown_content = markdown_content.replace('```\n\n', '```\n')
+        markdown_content = markdown_content.replace('\n\n```', '\n```')
         
         # 清理行首行尾空格
         lines = markdown_content.split('\n')
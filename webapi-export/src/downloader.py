@@ -283,18 +283,14 @@ class NoteDownloader:
                 if not att_guid:
                     continue
                 
-                # 下载附件内容
-                content = self.api_client.download_attachment(note_guid, att_guid)
+                # 附件内容直接流式写入文件，不在内存中缓存
+                attachment_path = self.storage.get_attachment_path(note_path, att_name)
+                size = self.api_client.download_attachment_to_file(note_guid, att_guid, attachment_path)
                 
-                if content:
-                    # 保存附件
-                    self.storage.save_attachment(
-                        note_path,
-                        att_name,
-                        content
-                    )
+                if size is not None:
+                    logger.info(f"保存附件: {attachment_path}")
                     self.stats['downloaded_attachments'] += 1
-                    self.stats['total_size'] += len(content)
+                    self.stats['total_size'] += size
                 else:
                     self.stats['failed_attachments'] += 1
                     
@@ -5,20 +5,99 @@
 将为知笔记导出的 JSON 格式文档转换为 Markdown 格式
 """
 
+from __future__ import annotations
+
+import io
+import os
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import re
+from typing import Dict, List, Any, Iterator, Optional
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# 文件名中的非法字符（含控制字符）统一替换为下划线；预编译的字符集正则一次遍历完成替换，
+# 对短标题（尤其含中文时）比 str.translate 更快
+_INVALID_FILENAME_CHARS = re.compile(r'[/\\:*?"<>|\x00-\x1f]')
+
+# 开头的标题标记及其后的空白
+_HEADING_PREFIX = re.compile(r'#+\s*')
+
+# 内容中第一个非空行
+_FIRST_NONEMPTY_LINE = re.compile(r'^\s*(\S.*)$', re.M)
+
+
+def _build_style_markers() -> List[tuple]:
+    """预先计算全部样式组合的 (前缀, 后缀)，下标按位表示 加粗/斜体/删除线/行内代码
+    
+    先应用的样式在内层：加粗 -> 斜体 -> 删除线 -> 行内代码
+    """
+    styles = ('**', '*', '~~', '`')
+    markers = []
+    for key in range(1 << len(styles)):
+        prefix = suffix = ''
+        for bit, mark in enumerate(styles):
+            if key & (1 << bit):
+                prefix, suffix = mark + prefix, suffix + mark
+        markers.append((prefix, suffix))
+    return markers
+
+
+_STYLE_MARKERS = _build_style_markers()
+
+
+def _style_key(attributes: Dict[str, Any]) -> int:
+    """把文本片段的样式属性压缩为 _STYLE_MARKERS 的下标
+    
+    颜色（style-color-*）Markdown 不原生支持，直接忽略
+    """
+    get = attributes.get
+    return ((1 if get('style-bold') else 0)
+            | (2 if get('style-italic') else 0)
+            | (4 if get('style-strike') else 0)
+            | (8 if get('style-code') else 0))
+
+
+def sanitize_filename(name: str, fallback: str = "untitled", max_length: int = 80) -> str:
+    """清理文件名中的非法字符"""
+    if not name:
+        name = fallback
+    # 先截断再去掉首尾空白，Windows 不允许文件名以点或空格结尾
+    name = _INVALID_FILENAME_CHARS.sub('_', name)[:max_length]
+    return name.strip().rstrip('. ') or fallback
+
+
+def _load_json(json_path: str) -> Any:
+    """读取并解析 JSON 文件，优先使用 orjson"""
+    with open(json_path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class JsonToMarkdownConverter:
     """JSON 到 Markdown 的转换器"""
     
+    __slots__ = ('_block_handlers', '_cell_cache')
+    
+    # 列数 -> 表格分隔线（不含首尾竖线），所有实例共用
+    _SEPARATOR_CACHE: Dict[int, str] = {}
+    
     def __init__(self):
-        self.indent_level = 0
-        self.in_table = False
+        # block 类型 -> 转换方法，统一以 (block, root_data) 调用
+        self._block_handlers = {
+            'text': self._convert_text_block,
+            'table': self._convert_table_block,
+        }
+        # 当前文档中已渲染的表格单元格，同一单元格被多次引用时直接复用
+        self._cell_cache: Dict[str, str] = {}
     
     def convert_file(self, json_path: str, output_path: str) -> bool:
         """
@@ -33,19 +112,31 @@ class JsonToMarkdownConverter:
         """
         try:
             # 读取 JSON 文件
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 转换为 Markdown
-            markdown_content = self.convert(data)
+            data = _load_json(json_path)
             
             # 确保输出目录存在
-            output_dir = Path(output_path).parent
-            output_dir.mkdir(parents=True, exist_ok=True)
+            output_file = Path(output_path)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # 写入 Markdown 文件
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
+            # 逐块转换并按字节写入大缓冲区，不在内存中拼出整篇文档；
+            # 二进制模式跳过文本模式的换行转换层，与 main.py 的输出保持一致。
+            # 先写入同目录下的临时文件，全部转换成功后再替换目标文件，
+            # 中途出错时保留原有的输出文件，不会留下写了一半的文件
+            tmp_path = f"{output_file}.tmp"
+            try:
+                with open(tmp_path, 'wb', buffering=1 << 20) as f:
+                    separator = b''
+                    for block_md in self.iter_blocks(data):
+                        f.write(separator)
+                        f.write(block_md.encode('utf-8'))
+                        separator = b'\n\n'
+                os.replace(tmp_path, output_file)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
             
             logger.info(f"成功转换: {json_path} -> {output_path}")
             return True
@@ -66,8 +157,7 @@ class JsonToMarkdownConverter:
         """
         try:
             # 读取 JSON 文件
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = _load_json(json_path)
             
             # 转换为 Markdown
             markdown_content = self.convert(data)
@@ -95,34 +185,22 @@ class JsonToMarkdownConverter:
         # 移除前导空白
         content = content.strip()
         
-        # 如果以标题开头，去掉 # 符号
-        if content.startswith('#'):
-            content = content.lstrip('#').strip()
+        # 如果以标题开头，去掉 # 符号及其后的空白
+        heading = _HEADING_PREFIX.match(content)
+        if heading:
+            content = content[heading.end():]
         
-        # 获取第一行
-        first_line = content.split('\n')[0].strip()
+        # 获取第一行（只扫描到第一个换行，不切分整篇内容）
+        newline = content.find('\n')
+        first_line = (content if newline < 0 else content[:newline]).strip()
         
-        # 如果第一行为空，尝试获取第二行
+        # 如果第一行为空，取第一个非空行
         if not first_line:
-            lines = [line.strip() for line in content.split('\n') if line.strip()]
-            first_line = lines[0] if lines else "untitled"
-        
-        # 截取前 max_length 个字符
-        filename = first_line[:max_length]
-        
-        # 移除文件名中的非法字符
-        invalid_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|', '\n', '\r', '\t']
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
+            match = _FIRST_NONEMPTY_LINE.search(content)
+            first_line = match.group(1).strip() if match else "untitled"
         
-        # 去掉前后空格
-        filename = filename.strip()
-        
-        # 如果结果为空，使用默认名称
-        if not filename:
-            filename = "untitled"
-        
-        return filename
+        # 移除非法字符并截取前 max_length 个字符，结果为空时使用默认名称
+        return sanitize_filename(first_line, max_length=max_length)
     
     def convert(self, data: Dict[str, Any]) -> str:
         """
@@ -134,19 +212,28 @@ class JsonToMarkdownConverter:
         Returns:
             str: Markdown 格式的文本
         """
+        return '\n\n'.join(self.iter_blocks(data))
+    
+    def iter_blocks(self, data: Dict[str, Any]) -> Iterator[str]:
+        """
+        逐个生成各 block 的 Markdown 文本（跳过空 block），块之间应以空行分隔
+        
+        写文件时按块写出，不必先拼出整篇文档
+        
+        Args:
+            data: 为知笔记的 JSON 数据结构
+        """
         if 'blocks' not in data:
             logger.warning("JSON 数据中没有找到 'blocks' 字段")
-            return ""
+            return
         
-        blocks = data['blocks']
-        markdown_lines = []
-        
-        for block in blocks:
-            block_md = self._convert_block(block, data)
+        # 单元格缓存只在同一篇文档内有效
+        self._cell_cache = {}
+        convert_block = self._convert_block
+        for block in data['blocks']:
+            block_md = convert_block(block, data)
             if block_md:
-                markdown_lines.append(block_md)
-        
-        return '\n\n'.join(markdown_lines)
+                yield block_md
     
     def _convert_block(self, block: Dict[str, Any], root_data: Dict[str, Any]) -> str:
         """
@@ -161,16 +248,15 @@ class JsonToMarkdownConverter:
         """
         block_type = block.get('type', 'text')
         
-        if block_type == 'text':
-            return self._convert_text_block(block)
-        elif block_type == 'table':
-            return self._convert_table_block(block, root_data)
-        else:
+        handler = self._block_handlers.get(block_type)
+        if handler is None:
             logger.warning(f"未知的 block 类型: {block_type}")
-            return self._convert_text_block(block)
+            handler = self._convert_text_block
+        return handler(block, root_data)
     
-    def _convert_text_block(self, block: Dict[str, Any]) -> str:
-        """转换文本类型的 block"""
+    def _convert_text_block(self, block: Dict[str, Any],
+                            root_data: Optional[Dict[str, Any]] = None) -> str:
+        """转换文本类型的 block（root_data 未使用，仅为与其他 block 转换方法签名一致）"""
         text_content = block.get('text', [])
         
         # 处理空文本
@@ -178,16 +264,7 @@ class JsonToMarkdownConverter:
             return ""
         
         # 提取文本和样式
-        result_parts = []
-        for text_item in text_content:
-            text = text_item.get('insert', '')
-            attributes = text_item.get('attributes', {})
-            
-            # 应用样式
-            styled_text = self._apply_text_styles(text, attributes)
-            result_parts.append(styled_text)
-        
-        result = ''.join(result_parts).strip()
+        result = self._render_text_items(text_content).strip()
         
         # 处理标题
         if block.get('heading'):
@@ -200,33 +277,27 @@ class JsonToMarkdownConverter:
         
         return result
     
-    def _apply_text_styles(self, text: str, attributes: Dict[str, Any]) -> str:
-        """应用文本样式"""
-        if not attributes:
-            return text
-        
-        # 加粗
-        if attributes.get('style-bold'):
-            text = f"**{text}**"
-        
-        # 斜体
-        if attributes.get('style-italic'):
-            text = f"*{text}*"
-        
-        # 删除线
-        if attributes.get('style-strike'):
-            text = f"~~{text}~~"
-        
-        # 行内代码
-        if attributes.get('style-code'):
-            text = f"`{text}`"
-        
-        # 颜色（作为注释保留）
-        if attributes.get('style-color-6'):
-            # Markdown 不原生支持颜色，可以作为注释或忽略
-            pass
+    def _render_text_items(self, text_items: List[Dict[str, Any]]) -> str:
+        """将文本片段列表渲染为带样式的 Markdown 文本，文本块和表格单元格共用
         
-        return text
+        样式标记和正文直接写入同一个缓冲区，不再为每个带样式的片段单独拼接字符串。
+        """
+        buf = io.StringIO()
+        write = buf.write
+        for text_item in text_items:
+            text = text_item.get('insert', '')
+            attributes = text_item.get('attributes')
+            # 空白片段加样式标记没有显示效果（如 "**   **" 不会被渲染为加粗，反而留下多余的星号），不加样式
+            if attributes and text and not text.isspace():
+                key = _style_key(attributes)
+                if key:
+                    prefix, suffix = _STYLE_MARKERS[key]
+                    write(prefix)
+                    write(text)
+                    write(suffix)
+                    continue
+            write(text)
+        return buf.getvalue()
     
     def _convert_table_block(self, block: Dict[str, Any], root_data: Dict[str, Any]) -> str:
         """转换表格类型的 block"""
@@ -237,25 +308,23 @@ class JsonToMarkdownConverter:
         if not rows or not cols or not children:
             return ""
         
-        # 构建表格数据
-        table_data = []
-        for i in range(rows):
-            row_data = []
-            for j in range(cols):
-                cell_index = i * cols + j
-                if cell_index < len(children):
-                    cell_id = children[cell_index]
-                    cell_content = self._get_cell_content(cell_id, root_data)
-                    row_data.append(cell_content)
-                else:
-                    row_data.append("")
-            table_data.append(row_data)
+        # 构建表格数据：单元格按行优先排列，先一次性取出全部内容再按列数切分成行，
+        # children 不足时用空单元格补齐
+        cell_count = rows * cols
+        get_cell_content = self._get_cell_content
+        cells = [get_cell_content(cell_id, root_data) for cell_id in children[:cell_count]]
+        cells += [""] * (cell_count - len(cells))
+        table_data = [cells[i:i + cols] for i in range(0, cell_count, cols)]
         
         # 转换为 Markdown 表格
         return self._format_markdown_table(table_data, block.get('hasRowTitle', False))
     
     def _get_cell_content(self, cell_id: str, root_data: Dict[str, Any]) -> str:
         """获取表格单元格内容"""
+        cached = self._cell_cache.get(cell_id)
+        if cached is not None:
+            return cached
+        
         if cell_id not in root_data:
             return ""
         
@@ -267,37 +336,26 @@ class JsonToMarkdownConverter:
         cell_texts = []
         for cell_block in cell_blocks:
             if 'text' in cell_block:
-                text_parts = []
-                for text_item in cell_block['text']:
-                    text = text_item.get('insert', '')
-                    attributes = text_item.get('attributes', {})
-                    styled_text = self._apply_text_styles(text, attributes)
-                    text_parts.append(styled_text)
-                cell_texts.append(''.join(text_parts))
+                cell_texts.append(self._render_text_items(cell_block['text']))
         
-        return ' '.join(cell_texts).strip()
+        content = self._cell_cache[cell_id] = ' '.join(cell_texts).strip()
+        return content
     
     def _format_markdown_table(self, table_data: List[List[str]], has_header: bool = False) -> str:
         """格式化为 Markdown 表格"""
         if not table_data:
             return ""
         
-        lines = []
-        
-        # 处理表头（第一行）
-        if table_data:
-            header = table_data[0]
-            lines.append('| ' + ' | '.join(header) + ' |')
-            
-            # 分隔线
-            separator = '| ' + ' | '.join(['---'] * len(header)) + ' |'
-            lines.append(separator)
-        
-        # 处理数据行
-        for row in table_data[1:]:
-            lines.append('| ' + ' | '.join(row) + ' |')
+        # 每行先只拼接单元格，第一行（表头）后插入分隔线；分隔线按列数缓存复用
+        row_texts = [' | '.join(row) for row in table_data]
+        col_count = len(table_data[0])
+        separator = self._SEPARATOR_CACHE.get(col_count)
+        if separator is None:
+            separator = self._SEPARATOR_CACHE.setdefault(col_count, ' | '.join(['---'] * col_count))
+        row_texts.insert(1, separator)
         
-        return '\n'.join(lines)
+        # 行首尾的竖线随换行一起在最后一次 join 中补上，不再逐行拼接
+        return '| ' + ' |\n| '.join(row_texts) + ' |'
 
 
 def convert_json_to_markdown(json_path: str, output_path: str) -> bool:
@@ -159,25 +159,31 @@ class LocalStorage:
         note_dir = note_path.parent
         return note_dir / 'assets'
     
+    def get_attachment_path(self, note_path: Path, attachment_name: str) -> Path:
+        """返回附件的保存路径（创建附件目录并处理重名）"""
+        # 创建附件目录
+        attachment_dir = self.get_attachment_dir(note_path)
+        attachment_dir.mkdir(exist_ok=True)
+        
+        # 清理文件名
+        safe_name = self.sanitize_filename(attachment_name)
+        attachment_path = attachment_dir / safe_name
+        
+        # 处理重名
+        if attachment_path.exists():
+            name, ext = os.path.splitext(safe_name)
+            counter = 1
+            while attachment_path.exists():
+                attachment_path = attachment_dir / f"{name}_{counter}{ext}"
+                counter += 1
+        
+        return attachment_path
+    
     def save_attachment(self, note_path: Path, attachment_name: str, 
                        content: bytes) -> Optional[Path]:
         """保存附件"""
         try:
-            # 创建附件目录
-            attachment_dir = self.get_attachment_dir(note_path)
-            attachment_dir.mkdir(exist_ok=True)
-            
-            # 清理文件名
-            safe_name = self.sanitize_filename(attachment_name)
-            attachment_path = attachment_dir / safe_name
-            
-            # 处理重名
-            if attachment_path.exists():
-                name, ext = os.path.splitext(safe_name)
-                counter = 1
-                while attachment_path.exists():
-                    attachment_path = attachment_dir / f"{name}_{counter}{ext}"
-                    counter += 1
+            attachment_path = self.get_attachment_path(note_path, attachment_name)
             
             # 保存文件
             with open(attachment_path, 'wb') as f: